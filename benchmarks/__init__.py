@@ -0,0 +1,7 @@
+"""
+Benchmarks for cbchannels
+
+Run from the repository root, for example:
+
+    python -m benchmarks.bench_routes
+"""
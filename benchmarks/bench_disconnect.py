@@ -0,0 +1,87 @@
+"""
+Disconnect storm: clients joined to several rooms leave all of them,
+rooms found by database lookups (like multichat example) vs memberships index of GroupConsumers
+"""
+from .utils import setup, measure, report
+
+setup(database=True)
+
+from channels import DEFAULT_CHANNEL_LAYER, Group, include  # NOQA
+from channels.asgi import channel_layers  # NOQA
+from channels.message import Message  # NOQA
+from django.contrib.auth.models import Group as Room  # NOQA
+
+from cbchannels.generic.base import GroupConsumers  # NOQA
+
+CLIENTS = 10000
+ROOMS = 3
+
+_rooms = {}
+
+
+class IndexConsumers(GroupConsumers):
+    channel_name = 'bench'
+    group_name = 'lobby'
+    path = '/index'
+
+    def on_receive(self, message, **kwargs):
+        self.join(message.content['text'])
+
+
+class LookupConsumers(GroupConsumers):
+    """Keeps ids of joined rooms, like channel session of multichat example"""
+    channel_name = 'bench'
+    group_name = 'lobby'
+    path = '/lookup'
+
+    def on_connect(self, message, **kwargs):
+        self.get_group().add(self.reply_channel)
+
+    def on_receive(self, message, **kwargs):
+        room = Room.objects.get(name=message.content['text'])
+        Group(room.name).add(self.reply_channel)
+        _rooms.setdefault(self.reply_channel.name, []).append(room.pk)
+
+    def on_disconnect(self, message, **kwargs):
+        for pk in _rooms.pop(self.reply_channel.name, []):
+            Group(Room.objects.get(pk=pk).name).discard(self.reply_channel)
+        self.get_group().discard(self.reply_channel)
+
+
+def _handle(router, channel_layer, channel, content):
+    message = Message(content, channel, channel_layer)
+    _consumer, kwargs = router.match(message)
+    _consumer(message, **kwargs)
+
+
+def main():
+    channel_layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+    router = include([IndexConsumers.as_routes(), LookupConsumers.as_routes()])
+    rooms = [Room.objects.create(name='room{}'.format(i)).name for i in range(ROOMS)]
+
+    results = []
+    for name, path in (('database lookups', '/lookup'), ('memberships index', '/index')):
+        def connect():
+            for i in range(CLIENTS):
+                reply_channel = 'bench.reply!{}'.format(i)
+                _handle(router, channel_layer, 'websocket.connect', {'path': path, 'reply_channel': reply_channel})
+                for room in rooms:
+                    _handle(router, channel_layer, 'websocket.receive',
+                            {'path': path, 'reply_channel': reply_channel, 'text': room})
+
+        def disconnect():
+            for i in range(CLIENTS):
+                _handle(router, channel_layer, 'websocket.disconnect',
+                        {'path': path, 'reply_channel': 'bench.reply!{}'.format(i)})
+
+        seconds = []
+        for _ in range(3):
+            connect()
+            seconds.append(measure(disconnect, repeat=1))
+            assert not any(channel_layer._groups.get(group) for group in rooms + ['lobby'])
+        results.append((name, min(seconds), CLIENTS))
+    report('Disconnect of {} clients joined to {} rooms (in-memory layer)'.format(CLIENTS, ROOMS), results)
+
+
+if __name__ == '__main__':
+    main()
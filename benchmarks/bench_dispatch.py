@@ -0,0 +1,65 @@
+"""
+Per-message overhead of consumers instantiation at wrapped consumer call
+"""
+from copy import copy
+
+import six
+
+from .utils import setup, measure, report
+
+setup()
+
+from channels import DEFAULT_CHANNEL_LAYER  # NOQA
+from channels.asgi import channel_layers  # NOQA
+from channels.message import Message  # NOQA
+
+from cbchannels import Consumers, consumer  # NOQA
+
+MESSAGES = 100000
+
+
+class BenchConsumers(Consumers):
+    channel_name = 'bench'
+
+    @consumer(action='(?P<action>[^/]+)')
+    def action(self, message, **kwargs):
+        return self.kwargs
+
+
+class LegacyConsumers(BenchConsumers):
+    """Consumers with eager instantiation, the way it was done without the factory"""
+
+    def __init__(self, message=None, kwargs={}, **init_kwargs):
+        self.message = message
+        self.reply_channel = getattr(message, 'reply_channel', None)
+        self.kwargs = copy(kwargs) or {}
+        self.kwargs.update(message.content.get('_kwargs', {}))
+
+        self._init_kwargs = init_kwargs
+        for key, value in six.iteritems(init_kwargs):
+            if key in ['message', 'kwargs', 'reply_channel']:
+                raise ValueError('Do not use "{}" key word at '
+                                 'Consumers create'.format(key))
+            setattr(self, key, value)
+
+
+def main():
+    init_kwargs = {'path': '/bench', 'model': object, 'paginate_by': 10, 'serializer_kwargs': {}}
+    message = Message({'action': 'list', 'reply_channel': 'bench.reply'}, 'bench',
+                      channel_layers[DEFAULT_CHANNEL_LAYER])
+    legacy = LegacyConsumers._wrap(LegacyConsumers.action, init_kwargs)
+    factory = BenchConsumers._wrap(BenchConsumers.action, init_kwargs)
+
+    def run(_consumer):
+        for _ in range(MESSAGES):
+            _consumer(message, action='list')
+
+    results = [
+        ('eager __init__', measure(lambda: run(legacy)), MESSAGES),
+        ('instance factory', measure(lambda: run(factory)), MESSAGES),
+    ]
+    report('Wrapped consumer call for {} messages'.format(MESSAGES), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Change events envelope building: json.dumps(...).replace('null', data) vs Encoder
+"""
+from __future__ import print_function
+
+import json
+
+from .utils import setup, measure
+
+setup()
+
+from cbchannels.encoding import BACKENDS, Encoder  # NOQA
+
+EVENTS = 100000
+
+
+def main():
+    data = json.dumps({'id': 1, 'username': 'bench', 'email': 'bench@example.com', 'is_active': True,
+                       'groups': list(range(20)), 'last_login': None})
+
+    def replace():
+        for _ in range(EVENTS):
+            json.dumps({'action': 'updated', 'data': None}).replace('null', data)
+
+    results = [('dumps + replace', measure(replace))]
+    for backend in sorted(name for name, dumps in BACKENDS.items() if dumps):
+        encoder = Encoder(backend)
+        results.append(('Encoder({})'.format(backend), measure(lambda: [encoder.event('updated', data)
+                                                                        for _ in range(EVENTS)])))
+
+    print('Envelope for {} change events'.format(EVENTS))
+    for name, seconds in results:
+        print('  {:<40} {:>12.0f} events/s'.format(name, EVENTS / seconds))
+
+
+if __name__ == '__main__':
+    main()
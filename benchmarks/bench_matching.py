@@ -0,0 +1,39 @@
+"""
+Route matching for consumers with many action filters: plain routes vs compiled routes
+"""
+from .utils import setup, measure, report
+
+setup()
+
+from channels import DEFAULT_CHANNEL_LAYER  # NOQA
+from channels.asgi import channel_layers  # NOQA
+from channels.message import Message  # NOQA
+
+from cbchannels import Consumers, consumer  # NOQA
+
+MESSAGES = 20000
+
+
+def _make_class(actions):
+    attrs = {'channel_name': 'bench'}
+    for i in range(actions):
+        attrs['action_{}'.format(i)] = consumer(action='action_{}$'.format(i))(lambda self, message: None)
+    return type(str('Bench{}'.format(actions)), (Consumers,), attrs)
+
+
+def main():
+    channel_layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+    results = []
+    for actions in (5, 50, 500):
+        cls = _make_class(actions)
+        # consumers are routed in the attribute names order, take the last one
+        last = max('action_{}'.format(i) for i in range(actions))
+        message = Message({'action': last}, 'bench', channel_layer)
+        for name, routes in (('plain', cls.as_routes()), ('compiled', cls.as_routes(compile_routes=True))):
+            results.append(('{} routes, {}'.format(actions, name),
+                            measure(lambda: [routes.match(message) for _ in range(MESSAGES)]), MESSAGES))
+    report('Match of {} messages'.format(MESSAGES), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Overhead of consumers instrumentation at wrapped consumer call: disabled vs default metrics registry,
+query counting and slow log (calls are fast, so stacks are never sampled)
+"""
+from .utils import setup, measure, report
+
+setup()
+
+from channels import DEFAULT_CHANNEL_LAYER  # NOQA
+from channels.asgi import channel_layers  # NOQA
+from channels.message import Message  # NOQA
+
+from cbchannels import Consumers, consumer  # NOQA
+
+MESSAGES = 100000
+
+
+class BenchConsumers(Consumers):
+    channel_name = 'bench'
+
+    @consumer(action='(?P<action>[^/]+)')
+    def action(self, message, **kwargs):
+        return self.kwargs
+
+
+def main():
+    message = Message({'action': 'list', 'reply_channel': 'bench.reply'}, 'bench',
+                      channel_layers[DEFAULT_CHANNEL_LAYER])
+
+    def run(_consumer):
+        for i in range(MESSAGES):
+            _consumer(message, action='list')
+
+    results = []
+    for name, init_kwargs in (('without metrics', {}), ('metrics registry', {'metrics': True}),
+                              ('query budget', {'query_budget': 10}), ('slow log', {'slow_threshold': 1})):
+        _consumer = BenchConsumers._wrap(BenchConsumers.action, init_kwargs)
+        results.append((name, measure(lambda: run(_consumer)), MESSAGES))
+    report('Wrapped consumer call for {} messages'.format(MESSAGES), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+"""
+Page 1 vs page 10,000 of a list: Paginator (COUNT + OFFSET) vs CursorPaginator (keyset)
+"""
+from .utils import setup, measure, report
+
+setup(database=True)
+
+from django.contrib.auth.models import User  # NOQA
+from django.core.paginator import Paginator  # NOQA
+
+from cbchannels.generic.pagination import CursorPaginator  # NOQA
+
+PER_PAGE = 20
+PAGES = 10000
+
+
+def main():
+    objects = PER_PAGE * PAGES
+    for start in range(0, objects, 10000):
+        User.objects.bulk_create([User(username='bench' + str(i), email='bench@example.com')
+                                  for i in range(start, start + 10000)])
+    queryset = User.objects.order_by('pk')
+    paginator = CursorPaginator(queryset, PER_PAGE)
+    # cursor of the last object of the page before the last one, as a client would get it
+    cursor = paginator.encode_cursor(queryset[objects - PER_PAGE - 1])
+
+    results = []
+    for number, cursor_value in ((1, None), (PAGES, cursor)):
+        results.append(('Paginator page {}'.format(number),
+                        measure(lambda: list(Paginator(queryset.all(), PER_PAGE).page(number).object_list), number=20),
+                        20))
+        results.append(('CursorPaginator page {}'.format(number),
+                        measure(lambda: CursorPaginator(queryset.all(), PER_PAGE).page(cursor_value).object_list,
+                                number=20),
+                        20))
+    report('Pages of {} users by {}'.format(objects, PER_PAGE), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Latency of websocket frame handling: internal channel hop vs in-process dispatch
+"""
+from .utils import setup, measure, report
+
+setup()
+
+from channels import DEFAULT_CHANNEL_LAYER, include  # NOQA
+from channels.asgi import channel_layers  # NOQA
+from channels.message import Message  # NOQA
+
+from cbchannels import WebsocketConsumers, consumer  # NOQA
+
+FRAMES = 20000
+
+
+class BenchConsumers(WebsocketConsumers):
+    channel_name = 'bench'
+
+    @consumer(action='create')
+    def create(self, message):
+        pass
+
+    @consumer(action='update')
+    def update(self, message):
+        pass
+
+
+def _worker_step(router, channel_layer, channels):
+    """Receive one message from the layer and run its consumer, like channels worker does"""
+    channel, content = channel_layer.receive_many(channels)
+    message = Message(content, channel, channel_layer)
+    _consumer, kwargs = router.match(message)
+    _consumer(message, **kwargs)
+
+
+def run(router, channel_layer, hops):
+    for _ in range(FRAMES):
+        channel_layer.send('websocket.receive', {'path': '/bench', 'action': 'update',
+                                                 'reply_channel': 'bench.reply!'})
+        for _ in range(hops):
+            _worker_step(router, channel_layer, ['websocket.receive', 'bench'])
+
+
+def main():
+    channel_layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+    internal = include([BenchConsumers.as_routes()])
+    in_process = include([BenchConsumers.as_routes(dispatch_in_process=True)])
+    results = [
+        ('internal channel', measure(lambda: run(internal, channel_layer, 2)), FRAMES),
+        ('in-process dispatch', measure(lambda: run(in_process, channel_layer, 1)), FRAMES),
+    ]
+    report('websocket.receive handling for {} frames (in-memory layer)'.format(FRAMES), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Route building time for many mounted Consumers classes
+"""
+from .utils import setup, measure, report
+
+setup()
+
+from channels import include, route  # NOQA
+
+from cbchannels import WebsocketConsumers, consumer  # NOQA
+
+CLASSES = 1000
+
+
+def _make_classes():
+    classes = []
+    for i in range(CLASSES):
+        attrs = {'channel_name': 'bench_{}'.format(i)}
+        for j in range(10):
+            attrs['action_{}'.format(j)] = consumer(action='action_{}'.format(j))(lambda self, message: None)
+        classes.append(type(str('Bench{}'.format(i)), (WebsocketConsumers,), attrs))
+    return classes
+
+
+def _scan_as_routes(cls, **kwargs):
+    """Routes building with dir() scanning, the way it was done without registry"""
+    _routes = []
+    for attr_name in dir(cls):
+        _consumer = getattr(cls, attr_name)
+        if not hasattr(_consumer, '_consumer'):
+            continue
+        name = cls._get_channel_name_for_consumer(_consumer, **kwargs)
+        filters = {key: cls._get_filter_value(_consumer, key, **kwargs) for key
+                   in _consumer._consumer['filter'].keys()}
+        _routes.append(route(name, cls._wrap(_consumer, kwargs), **filters))
+    return include(_routes)
+
+
+def main():
+    classes = _make_classes()
+    results = [
+        ('dir() scan', measure(lambda: [_scan_as_routes(cls, path='/t') for cls in classes]), CLASSES),
+        ('registry', measure(lambda: [cls.as_routes(path='/t') for cls in classes]), CLASSES),
+    ]
+    report('as_routes for {} mounted classes'.format(CLASSES), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""
+SimpleSerializer vs CompiledSerializer for lists and single objects
+"""
+from .utils import setup, measure, report
+
+setup(database=True)
+
+from django.contrib.auth.models import User  # NOQA
+
+from cbchannels.generic.serializers import CompiledSerializer, SimpleSerializer  # NOQA
+
+OBJECTS = 500
+
+
+def main():
+    User.objects.bulk_create([User(username='bench' + str(i), email='bench@example.com') for i in range(OBJECTS)])
+    queryset = User.objects.order_by('pk')
+    user = queryset.first()
+
+    results = []
+    for serializer_class in (SimpleSerializer, CompiledSerializer):
+        results.append(('{} many=True'.format(serializer_class.__name__),
+                        measure(lambda: serializer_class(queryset.all(), many=True).data), OBJECTS))
+    for serializer_class in (SimpleSerializer, CompiledSerializer):
+        results.append(('{} single'.format(serializer_class.__name__),
+                        measure(lambda: serializer_class(user, fields=['username', 'email']).data, number=OBJECTS),
+                        OBJECTS))
+    report('Serialization of {} users'.format(OBJECTS), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+"""
+Saves of a model with ModelSubscribeConsumers mounted on a filtered queryset:
+EXISTS query per save vs in-memory filter
+"""
+from __future__ import print_function
+
+from .utils import setup, measure, report, disconnect_signals, count_queries
+
+setup(database=True)
+
+from django.contrib.auth.models import User  # NOQA
+
+from cbchannels.generic.models import ModelSubscribeConsumers  # NOQA
+
+SAVES = 2000
+
+
+def main():
+    user = User.objects.create(username='bench', is_active=True)
+
+    def saves(number=SAVES):
+        for i in range(number):
+            user.username = 'bench' + str(i)
+            user.save()
+
+    results, queries = [], []
+    for name, in_memory_filter in (('exists query', False), ('in-memory filter', True)):
+        disconnect_signals(User)
+        ModelSubscribeConsumers.as_routes(model=User, queryset=User.objects.filter(is_active=True),
+                                          in_memory_filter=in_memory_filter, serializer_kwargs={'fields': ['username']})
+        results.append((name, measure(saves), SAVES))
+        queries.append((name, count_queries(lambda: saves(100)) / 100.0))
+    report('{} saves with subscription on filtered queryset'.format(SAVES), results)
+    for name, count in queries:
+        print('  {:<40} {:>10.1f} queries/save'.format(name, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Websocket frames of an authenticated user: channel session and user loaded on every frame
+vs kept for the connection (`session_cache_timeout`)
+"""
+from .utils import setup, measure, report
+
+setup(database=True)
+
+from channels import DEFAULT_CHANNEL_LAYER, include  # NOQA
+from channels.asgi import channel_layers  # NOQA
+from channels.message import Message  # NOQA
+from channels.sessions import session_for_reply_channel  # NOQA
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY  # NOQA
+from django.contrib.auth.models import User  # NOQA
+
+from cbchannels import WebsocketConsumers  # NOQA
+from cbchannels.generic.auth import UserMixin  # NOQA
+
+FRAMES = 2000
+
+
+class Consumers(UserMixin, WebsocketConsumers):
+    channel_name = 'bench'
+    path = '/plain'
+
+    def on_receive(self, message, **kwargs):
+        assert self.user.is_authenticated
+
+
+def _handle(router, channel_layer, channel, content):
+    message = Message(content, channel, channel_layer)
+    _consumer, kwargs = router.match(message)
+    _consumer(message, **kwargs)
+
+
+def main():
+    channel_layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+    router = include([Consumers.as_routes(), Consumers.as_routes(path='/cached', session_cache_timeout=60)])
+    user = User.objects.create_user('bench', 'bench@bench.bench', 'bench')
+
+    results = []
+    for name, path in (('loaded per frame', '/plain'), ('connection cache', '/cached')):
+        reply_channel = 'bench.reply!{}'.format(path.strip('/'))
+        session = session_for_reply_channel(reply_channel)
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save(must_create=True)
+
+        def frames():
+            for i in range(FRAMES):
+                _handle(router, channel_layer, 'websocket.receive', {'path': path, 'reply_channel': reply_channel, 'text': 'ping'})
+
+        seconds = measure(frames)
+        results.append(('{} ({:.0f} frames/s)'.format(name, FRAMES / seconds), seconds, FRAMES))
+    report('{} websocket frames of an authenticated user (database sessions)'.format(FRAMES), results)
+
+
+if __name__ == '__main__':
+    main()
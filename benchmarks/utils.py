@@ -0,0 +1,52 @@
+from __future__ import print_function
+
+import os
+from timeit import default_timer
+
+import django
+
+
+def setup(database=False):
+    """Configure django with test settings, create test database if needed"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cbchannels.tests.settings')
+    django.setup()
+    if database:
+        from django.db import connection
+        connection.creation.create_test_db(verbosity=0)
+
+
+def disconnect_signals(model):
+    """Disconnect all post_save/post_delete receivers of the model"""
+    from django.db.models.signals import post_save, post_delete
+    for signal in (post_save, post_delete):
+        with signal.lock:
+            signal.receivers = [receiver for receiver in signal.receivers if receiver[0][1] != id(model)]
+            signal.sender_receivers_cache.clear()
+
+
+def count_queries(func):
+    """Return number of queries made by func"""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as context:
+        func()
+    return len(context.captured_queries)
+
+
+def measure(func, number=1, repeat=3):
+    """Return best time of `repeat` runs of `number` calls of func"""
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        for _ in range(number):
+            func()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(title, results):
+    """Print table of results: list of (name, seconds, count)"""
+    print(title)
+    for name, seconds, count in results:
+        print('  {:<40} {:>10.3f} ms {:>12.2f} us/op'.format(name, seconds * 1000, seconds * 1e6 / count))
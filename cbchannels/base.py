@@ -1,18 +1,26 @@
 from __future__ import unicode_literals
 
-import json
+from collections import namedtuple
 from inspect import isfunction
 from copy import copy
 from functools import wraps
+from timeit import default_timer
 
 import six
+from django.utils.functional import cached_property
 
 try:
     from django.channels import include, route, Channel
+    from django.channels.message import Message
 except ImportError:
     from channels import include, route, Channel
+    from channels.message import Message
 
+from .encoding import default_encoder
 from .exceptions import ConsumerError
+from .metrics import QueryCounter, check_query_budget, get_sink
+from .routing import compile_routing
+from .slowlog import get_slow_log, sampler
 
 
 def consumer(channel_name=None, decorators=[], **kwargs):
@@ -29,57 +37,211 @@ def consumer(channel_name=None, decorators=[], **kwargs):
     return wrap
 
 
-class Consumers(object):
+_RESERVED_KWARGS = ('message', 'kwargs', 'reply_channel')
+
+_ConsumerSpec = namedtuple('_ConsumerSpec', ['consumer', 'channel_name', 'filters', 'dynamic_filters'])
+
+
+def _is_dynamic(value):
+    return callable(value) or isinstance(value, (classmethod, staticmethod))
+
+
+def _is_data_descriptor(cls, name):
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return hasattr(type(klass.__dict__[name]), '__set__')
+    return False
+
+
+class ConsumersMeta(type):
+    """
+    Metaclass that collects consumers of the class once at class creation,
+    so routes building does not need to scan the class attributes every time
+    """
+
+    def __init__(cls, name, bases, attrs):
+        super(ConsumersMeta, cls).__init__(name, bases, attrs)
+        cls._registry = tuple(cls._collect_consumers())
+
+
+class Consumers(six.with_metaclass(ConsumersMeta, object)):
     """Basic class for Class Base Consumers"""
     channel_name = None
     decorators = []
+    compile_routes = False
+    metrics = None
+    query_budget = None
+    slow_threshold = None
+    slow_log = None
+    _routes = ()
 
     def __init__(self, message=None, kwargs={}, **init_kwargs):
         self.message = message
         self.reply_channel = getattr(message, 'reply_channel', None)
-        self.kwargs = copy(kwargs) or {}
-        self.kwargs.update(message.content.get('_kwargs', {}))
+        self._route_kwargs = copy(kwargs) or {}
 
+        self._check_init_kwargs(init_kwargs)
         self._init_kwargs = init_kwargs
         for key, value in six.iteritems(init_kwargs):
-            if key in ['message', 'kwargs', 'reply_channel']:
+            setattr(self, key, value)
+
+    @cached_property
+    def kwargs(self):
+        """Route kwargs merged with kwargs passed through the internal channel"""
+        kwargs = self._route_kwargs
+        kwargs.update(self.message.content.get('_kwargs', {}))
+        return kwargs
+
+    @classmethod
+    def _check_init_kwargs(cls, init_kwargs):
+        for key in init_kwargs:
+            if key in _RESERVED_KWARGS:
                 raise ValueError('Do not use "{}" key word at '
                                  'Consumers create'.format(key))
-            setattr(self, key, value)
 
     @classmethod
-    def _wrap(cls, func, init_kwargs=None):
+    def _get_factory(cls, init_kwargs, routes=()):
+        """
+        Return function that creates consumers instance for the message,
+        instance gets routes of its mount as `_routes`. Init kwargs are checked once here.
+        If __init__ is not overridden, instance created without calling it:
+        plain attributes are copied into instance dict at once
+        and only data descriptors (properties with setter) are set one by one
+        """
+        cls._check_init_kwargs(init_kwargs)
+        if six.get_unbound_function(cls.__init__) is not six.get_unbound_function(Consumers.__init__):
+            def init_factory(message, kwargs):
+                self = cls(message, kwargs, **init_kwargs)
+                self._routes = routes
+                return self
+            return init_factory
+
+        attrs, descriptors = {}, []
+        for key, value in six.iteritems(init_kwargs):
+            if _is_data_descriptor(cls, key):
+                descriptors.append((key, value))
+            else:
+                attrs[key] = value
+
+        def factory(message, kwargs):
+            self = cls.__new__(cls)
+            self.__dict__.update(attrs)
+            self.message = message
+            self.reply_channel = getattr(message, 'reply_channel', None)
+            self._route_kwargs = kwargs
+            self._init_kwargs = init_kwargs
+            self._routes = routes
+            for key, value in descriptors:
+                setattr(self, key, value)
+            return self
+        return factory
+
+    @classmethod
+    def _wrap(cls, func, init_kwargs=None, routes=()):
         """
         Wrapper function for every consumer
         apply decorators and define message, kwargs and reply_channel
         """
-        if getattr(func, '_wrapped', None):
-            return func
-
-        @wraps(func)
-        def _consumer(message, **kwargs):
-            self = cls(message, kwargs, **init_kwargs)
-            try:
-                return func(self, message, **kwargs)
-            except Exception as e:
-                self.at_exception(e)
-
-        for decorator in cls.get_decorators(**init_kwargs):
-            _consumer = decorator(_consumer)
+        return cls._get_wrapper(init_kwargs, routes)(func)
 
-        for decorator in func._consumer['decorators']:
-            _consumer = decorator(_consumer)
+    @classmethod
+    def _get_wrapper(cls, init_kwargs=None, routes=()):
+        """
+        Return function that wraps consumers of one mount,
+        instance factory, instrumentation and class decorators are prepared once for all of them
+        With `metrics` (sink or True for the default registry) calls are measured,
+        with `query_budget` queries are counted and calls over the budget are logged,
+        with `slow_threshold` (seconds) stacks of long calls are sampled and slow calls are written to `slow_log`,
+        otherwise the wrapper is left without any instrumentation
+        """
+        init_kwargs = init_kwargs or {}
+        factory = cls._get_factory(init_kwargs, routes)
+        sink = get_sink(init_kwargs.get('metrics', cls.metrics))
+        query_budget = init_kwargs.get('query_budget', cls.query_budget)
+        slow_threshold = init_kwargs.get('slow_threshold', cls.slow_threshold)
+        slow_log = get_slow_log(init_kwargs.get('slow_log', cls.slow_log)) if slow_threshold is not None else None
+        decorators = cls.get_decorators(**init_kwargs)
+        instrumented = not (sink is None and query_budget is None and slow_log is None)
+
+        def wrap(func):
+            if getattr(func, '_wrapped', None):
+                return func
+            if not instrumented:
+                @wraps(func)
+                def _consumer(message, **kwargs):
+                    self = factory(message, kwargs)
+                    try:
+                        return func(self, message, **kwargs)
+                    except Exception as e:
+                        self.at_exception(e)
+            else:
+                @wraps(func)
+                def _consumer(message, **kwargs):
+                    self = factory(message, kwargs)
+                    error = False
+                    queries = None if query_budget is None else QueryCounter()
+                    call = None if slow_log is None else sampler.start(slow_threshold)
+                    start = default_timer()
+                    try:
+                        if queries is None:
+                            return func(self, message, **kwargs)
+                        with queries:
+                            return func(self, message, **kwargs)
+                    except Exception as e:
+                        error = True
+                        self.at_exception(e)
+                    finally:
+                        seconds = default_timer() - start
+                        labels = (cls.__name__, func.__name__, message.channel.name)
+                        if call is not None:
+                            sampler.stop(call)
+                            if seconds >= slow_threshold:
+                                slow_log.record(labels, kwargs, message, seconds, call)
+                        if queries is not None:
+                            over_budget = check_query_budget(labels, queries, query_budget)
+                        if sink is not None:
+                            sink.observe(labels, seconds, error)
+                            if queries is not None and hasattr(sink, 'observe_queries'):
+                                sink.observe_queries(labels, queries.count, queries.time, over_budget)
+
+            for decorator in decorators:
+                _consumer = decorator(_consumer)
+
+            for decorator in func._consumer['decorators']:
+                _consumer = decorator(_consumer)
+
+            _consumer._wrapped = True
+            return _consumer
+        return wrap
 
-        _consumer._wrapped = True
-        return _consumer
+    @classmethod
+    def _collect_consumers(cls):
+        """
+        Generator yield consumer specs: consumer, its channel name and filters
+        split on static values and values that depend on routes kwargs
+        """
+        for attr_name in dir(cls):
+            attr = getattr(cls, attr_name)
+            if not hasattr(attr, '_consumer'):
+                continue
+            filters, dynamic_filters = {}, {}
+            for key, value in six.iteritems(attr._consumer['filter']):
+                if _is_dynamic(value):
+                    dynamic_filters[key] = value
+                else:
+                    filters[key] = value
+            yield _ConsumerSpec(attr, attr._consumer.get('channel_name', None), filters, dynamic_filters)
 
     @classmethod
     def _get_consumers(cls):
         """Generator yield internal consumers"""
-        for attr_name in dir(cls):
-            attr = getattr(cls, attr_name)
-            if hasattr(attr, '_consumer'):
-                yield attr
+        for spec in cls._registry:
+            yield spec.consumer
+
+    @classmethod
+    def _get_route_specs(cls, **kwargs):
+        """Return specs of consumers to route with given routes kwargs"""
+        return cls._registry
 
     @classmethod
     def _get_channel_name(cls, **kwargs):
@@ -109,7 +271,10 @@ class Consumers(object):
 
     @classmethod
     def _get_channel_name_for_consumer(cls, consumer, **kwargs):
-        value = consumer._consumer.get('channel_name', None)
+        return cls._resolve_channel_name(consumer._consumer.get('channel_name', None), **kwargs)
+
+    @classmethod
+    def _resolve_channel_name(cls, value, **kwargs):
         return cls._get_callable_value(value, **kwargs) or kwargs.get('channel_name') or cls._get_channel_name(**kwargs)
 
     def at_exception(self, e):
@@ -123,17 +288,20 @@ class Consumers(object):
     def as_routes(cls, **kwargs):
         """
         Create includes of all consumers
+        With `compile_routes` routes of one channel are merged into one indexed route
         :param kwargs:
         :return: key words arguments such as `channel_name` or `path`
         """
         _routes = []
-        for _consumer in cls._get_consumers():
-            name = cls._get_channel_name_for_consumer(_consumer, **kwargs)
-            if callable(name):
-                name = name(cls, **kwargs)
-            filters = {key: cls._get_filter_value(_consumer, key, **kwargs) for key
-                       in _consumer._consumer['filter'].keys()}
-            _routes.append(route(name, cls._wrap(_consumer, kwargs), **filters))
+        wrap = cls._get_wrapper(kwargs, _routes)
+        for spec in cls._get_route_specs(**kwargs):
+            name = cls._resolve_channel_name(spec.channel_name, **kwargs)
+            filters = dict(spec.filters)
+            for key, value in six.iteritems(spec.dynamic_filters):
+                filters[key] = cls._get_callable_value(value, **kwargs)
+            _routes.append(route(name, wrap(spec.consumer), **filters))
+        if kwargs.get('compile_routes', cls.compile_routes):
+            _routes[:] = compile_routing(_routes)
         return include(_routes)
 
     # BASE CONSUMERS
@@ -151,6 +319,9 @@ class Consumers(object):
 
 class WebsocketConsumers(Consumers):
     path = ''
+    encoder = default_encoder
+    dispatch_in_process = False
+    dispatch_fallback = False
 
     @classmethod
     def _get_path(cls, **kwargs):
@@ -183,8 +354,25 @@ class WebsocketConsumers(Consumers):
                 content['reply_channel'] = content['reply_channel'].name
             if self.kwargs:
                 content['_kwargs'] = self.kwargs
+            if self.dispatch_in_process:
+                if self.dispatch(content) or not self.dispatch_fallback:
+                    return
             self.send(content)
 
+    def dispatch(self, content):
+        """
+        Call consumer of the internal channel that matches the content in the current process,
+        without sending it through the channel layer. Return True if consumer found
+        """
+        message = Message(content, self.get_channel_name(), self.message.channel_layer)
+        for _route in self._routes:
+            match = _route.match(message)
+            if match is not None:
+                _consumer, kwargs = match
+                _consumer(message, **kwargs)
+                return True
+        return False
+
     @property
     def channel(self):
         return Channel(self.get_channel_name())
@@ -194,4 +382,4 @@ class WebsocketConsumers(Consumers):
         self.channel.send(content)
 
     def reply(self, text):
-        super(WebsocketConsumers, self).reply({"text": json.dumps(text)})
+        super(WebsocketConsumers, self).reply({"text": self.encoder.dumps(text)})
@@ -0,0 +1,182 @@
+import copy
+import datetime
+import decimal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import six
+
+from django.db.models.signals import post_save, post_delete
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+_DEFAULT = object()
+
+
+class LRUCache(object):
+    """
+    Thread safe in-process cache with least recently used eviction and expiration of keys.
+    Has the subset of django cache API: get, set, add, delete, incr and clear
+
+    Usage:
+
+    cache = LRUCache(maxsize=1024, timeout=60)
+    cache.set('key', 'value', timeout=None)  # never expires
+    """
+
+    def __init__(self, maxsize=1024, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        value, expires = self._data.pop(key)
+        if expires is not None and expires <= time.time():
+            raise KeyError(key)
+        self._data[key] = value, expires
+        return value
+
+    def _set(self, key, value, timeout=_DEFAULT):
+        timeout = self.timeout if timeout is _DEFAULT else timeout
+        self._data.pop(key, None)
+        self._data[key] = value, None if timeout is None else time.time() + timeout
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                return self._get(key)
+            except KeyError:
+                return default
+
+    def set(self, key, value, timeout=_DEFAULT):
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=_DEFAULT):
+        """
+        Set the value if the key does not exist, return True if it is set
+        """
+        with self._lock:
+            try:
+                self._get(key)
+            except KeyError:
+                self._set(key, value, timeout)
+                return True
+            return False
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            try:
+                value = self._get(key) + delta
+            except KeyError:
+                raise ValueError('Key "{}" not found'.format(key))
+            self._data[key] = value, self._data[key][1]
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_IMMUTABLE = six.string_types + six.integer_types + (
+    bytes, float, bool, type(None), decimal.Decimal, datetime.date, datetime.time, datetime.timedelta, uuid.UUID)
+
+
+def _copy_instance(instance):
+    """
+    Copy of the cached instance: mutable values (JSON and array fields, related objects) are deep copied,
+    prefetched objects and fields cache of the state are dropped
+    """
+    clone = instance.__class__.__new__(instance.__class__)
+    for key, value in six.iteritems(instance.__dict__):
+        if key in ('_state', '_prefetched_objects_cache'):
+            continue
+        clone.__dict__[key] = value if isinstance(value, _IMMUTABLE) else copy.deepcopy(value)
+    clone._state = copy.copy(instance._state)
+    if hasattr(clone._state, 'fields_cache'):
+        clone._state.fields_cache = {}
+    return clone
+
+
+class InstanceCache(object):
+    """
+    Caches model instances by SQL of their lookup querysets. Entries are valid until post_save/post_delete
+    of the instance in this process or the timeout. Returns copies, so changes of them do not affect the cache
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._watched = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version_key(model, pk):
+        return 'version', model._meta.concrete_model._meta.db_table, pk
+
+    def _version(self, instance):
+        key = self._version_key(instance.__class__, instance.pk)
+        version = self.cache.get(key)
+        if version is None:
+            version = int(time.time() * 1000)
+            self.cache.set(key, version, timeout=None)
+        return version
+
+    def _invalidate(self, sender, instance, **kwargs):
+        key = self._version_key(sender, instance.pk)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            pass
+
+    def watch(self, model):
+        with self._lock:
+            if model in self._watched:
+                return
+            self._watched.add(model)
+        uid = 'cbchannels_instance_{}'.format(id(self))
+        post_save.connect(self._invalidate, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(self._invalidate, sender=model, weak=False, dispatch_uid=uid)
+
+    @staticmethod
+    def _key(queryset, scope=None):
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return None
+        return 'instance', scope, queryset.db, sql, repr(params)
+
+    def get(self, queryset, scope=None, timeout=None):
+        """
+        Return copy of `queryset.get()` result, scope - additional part of the key, e.g. reply channel name
+        """
+        key = self._key(queryset, scope)
+        if key is None:
+            return queryset.get()
+        entry = self.cache.get(key)
+        if entry is not None:
+            instance, version = entry
+            if self.cache.get(self._version_key(instance.__class__, instance.pk)) == version:
+                return _copy_instance(instance)
+        self.watch(queryset.model)
+        self.watch(queryset.model._meta.concrete_model)
+        instance = queryset.get()
+        self.cache.set(key, (instance, self._version(instance)), timeout=timeout)
+        return _copy_instance(instance)
+
+
+instance_cache = InstanceCache(LRUCache(maxsize=4096))
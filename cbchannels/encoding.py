@@ -0,0 +1,95 @@
+from __future__ import unicode_literals
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def _json_dumps(content):
+    return json.dumps(content)
+
+
+def _orjson_dumps(content):
+    try:
+        return orjson.dumps(content).decode('utf-8')
+    except TypeError:
+        return _json_dumps(content)
+
+
+def _ujson_dumps(content):
+    try:
+        return ujson.dumps(content)
+    except (TypeError, OverflowError):
+        return _json_dumps(content)
+
+
+BACKENDS = {
+    'json': _json_dumps,
+    'orjson': _orjson_dumps if orjson else None,
+    'ujson': _ujson_dumps if ujson else None,
+}
+
+
+def get_dumps(backend='json'):
+    """
+    Return dumps function of the JSON backend, `auto` - the fastest one of installed
+    """
+    if backend == 'auto':
+        return BACKENDS['orjson'] or BACKENDS['ujson'] or BACKENDS['json']
+    if not BACKENDS.get(backend):
+        raise ValueError('JSON backend "{}" is not available'.format(backend))
+    return BACKENDS[backend]
+
+
+class Encoder(object):
+    """
+    Builds texts of messages sent to websockets.
+    Change events wrap already serialized data into the envelope by precomputed per action prefixes,
+    so the data is not parsed or scanned again.
+    Without backend `CBCHANNELS_JSON_BACKEND` setting is used, `json` by default: faster backends
+    (`orjson`, `ujson`, `auto`) are opt-in, they encode some values (datetime, UUID, NaN) differently
+
+    Usage:
+
+    class MyConsumers(WebsocketConsumers):
+        encoder = Encoder(backend='orjson')
+    """
+
+    def __init__(self, backend=None):
+        self._dumps = None if backend is None else get_dumps(backend)
+        self._prefixes = {}
+
+    @property
+    def dumps(self):
+        if self._dumps is None:
+            from django.conf import settings
+            self._dumps = get_dumps(getattr(settings, 'CBCHANNELS_JSON_BACKEND', 'json'))
+        return self._dumps
+
+    def _prefix(self, action):
+        if action not in self._prefixes:
+            self._prefixes[action] = '{"action":' + self.dumps(action) + ',"data":'
+        return self._prefixes[action]
+
+    def event(self, action, data):
+        """
+        Return text of change event, data - serialized object
+        """
+        return self._prefix(action) + data + '}'
+
+    def batch(self, events):
+        """
+        Return text of batch of change events, events - list of (action, data)
+        """
+        return self._prefix('batch') + '[' + ','.join(self.event(action, data) for action, data in events) + ']}'
+
+
+default_encoder = Encoder()
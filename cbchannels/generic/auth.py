@@ -8,16 +8,24 @@ except ImportError:
                                channel_session_user)
     from channels.sessions import channel_session
 
+from .sessions import cached_channel_session_user
+
 
 class UserMixin(object):
+    """
+    With `session_cache_timeout` session data is kept in process memory for the connection,
+    user is loaded and checked on every message
+    """
+    session_cache_timeout = None
 
     @classmethod
     def get_decorators(cls, **kwargs):
         decorators = super(UserMixin, cls).get_decorators(**kwargs)
-        decorators.append(channel_session_user)
-        if channel_session in decorators:
-            # channel_session_user already include channel_session decorator
-            decorators.remove(channel_session)
+        timeout = kwargs.get('session_cache_timeout', cls.session_cache_timeout)
+        # channel_session_user already include channel_session decorator
+        decorators = [decorator for decorator in decorators
+                      if decorator is not channel_session and not getattr(decorator, '_channel_session', False)]
+        decorators.append(cached_channel_session_user(timeout) if timeout else channel_session_user)
         return decorators
 
     def on_connect(self, *args, **kwargs):
@@ -1,4 +1,9 @@
-import json
+import logging
+import threading
+import uuid
+
+from django.core.cache import caches
+
 try:
     from django.channels import Group
     from django.channels.sessions import channel_session, http_session
@@ -7,10 +12,27 @@ except ImportError:
     from channels.sessions import channel_session, http_session
 
 from ..base import WebsocketConsumers
+from ..cache import LRUCache
+from .sessions import cached_channel_session
+
+logger = logging.getLogger('cbchannels.groups')
+
+_GROUPS_SESSION_KEY = '_cbchannels_groups'
+_memberships = LRUCache(maxsize=100000)
+_memberships_lock = threading.Lock()
+_permissions = LRUCache(maxsize=10000)
 
 
 class GroupMixin(object):
+    """
+    Groups joined by `join` are remembered for the reply channel, so `leave_all` discards it from all of them
+    without lookups of group names. Memberships are kept in the channel session if consumers use it
+    (see SessionMixin) or in `membership_cache` django cache if it is set. Otherwise they are remembered
+    best-effort in a bounded process memory index: disconnect handled by another process (or after eviction)
+    leaves only the given groups
+    """
     group_name = None
+    membership_cache = None
 
     def get_group_name(self, **kwargs):
         return (self.group_name or self.channel_name).format(**kwargs)
@@ -19,7 +41,82 @@ class GroupMixin(object):
         return Group(self.get_group_name(**self.kwargs))
 
     def broadcast(self, content):
-        self.get_group().send({'text': json.dumps(content)})
+        self.get_group().send({'text': self.encoder.dumps(content)})
+
+    @property
+    def _session(self):
+        return getattr(self.message, 'channel_session', None)
+
+    @property
+    def _memberships_key(self):
+        return 'cbchannels:groups:' + self.reply_channel.name
+
+    def _update_memberships(self, add=(), remove=()):
+        session = self._session
+        if session is not None:
+            groups = set(session.get(_GROUPS_SESSION_KEY, [])).union(add).difference(remove)
+            session[_GROUPS_SESSION_KEY] = sorted(groups)
+            return
+        if self.membership_cache is None:
+            with _memberships_lock:
+                groups = _memberships.get(self.reply_channel.name)
+                if groups is None:
+                    groups = set()
+                    _memberships.set(self.reply_channel.name, groups, timeout=None)
+                groups.update(add)
+                groups.difference_update(remove)
+            return
+        # read and write are not atomic: order messages of the reply channel (enforce_ordering) if they join groups
+        cache = caches[self.membership_cache]
+        groups = set(cache.get(self._memberships_key, [])).union(add).difference(remove)
+        cache.set(self._memberships_key, sorted(groups), None)
+
+    def _pop_memberships(self):
+        """Return joined groups and forget them, None if memberships of the reply channel are not found"""
+        session = self._session
+        if session is not None:
+            return set(session.pop(_GROUPS_SESSION_KEY, []))
+        if self.membership_cache is None:
+            with _memberships_lock:
+                groups = _memberships.get(self.reply_channel.name)
+                _memberships.delete(self.reply_channel.name)
+            return groups
+        cache = caches[self.membership_cache]
+        groups = cache.get(self._memberships_key)
+        cache.delete(self._memberships_key)
+        return None if groups is None else set(groups)
+
+    def join(self, group_name):
+        Group(group_name).add(self.reply_channel)
+        self._update_memberships(add=[group_name])
+
+    def leave(self, group_name):
+        Group(group_name).discard(self.reply_channel)
+        self._update_memberships(remove=[group_name])
+
+    def get_joined_groups(self):
+        session = self._session
+        if session is not None:
+            return set(session.get(_GROUPS_SESSION_KEY, []))
+        if self.membership_cache is None:
+            with _memberships_lock:
+                return set(_memberships.get(self.reply_channel.name, ()))
+        return set(caches[self.membership_cache].get(self._memberships_key, []))
+
+    def leave_all(self, *group_names):
+        """
+        Discard reply channel from all joined groups and the given ones
+        """
+        groups = self._pop_memberships()
+        if groups is None:
+            # the process index is best-effort, lost memberships of the shared cache are worth attention
+            log = logger.debug if self.membership_cache is None else logger.warning
+            log('Joined groups of %s are not found (joined by another process or evicted), '
+                'it is discarded only from %s', self.reply_channel.name, ', '.join(group_names) or 'nothing')
+            groups = set()
+        channel_layer = self.message.channel_layer
+        for group_name in groups.union(group_names):
+            channel_layer.group_discard(group_name, self.reply_channel.name)
 
 
 class GroupConsumers(GroupMixin, WebsocketConsumers):
@@ -35,11 +132,12 @@ class GroupConsumers(GroupMixin, WebsocketConsumers):
 
     def on_connect(self, message, **kwargs):
         super(GroupConsumers, self).on_connect(message, **kwargs)
-        self.get_group().add(self.reply_channel)
+        self.join(self.get_group_name(**self.kwargs))
 
     def on_disconnect(self, message, **kwargs):
         super(GroupConsumers, self).on_disconnect(message, **kwargs)
-        self.get_group().discard(self.reply_channel)
+        # own group is left even if memberships are not found
+        self.leave_all(self.get_group_name(**self.kwargs))
 
     def on_receive(self, message, **kwargs):
         super(GroupConsumers, self).on_receive(message, **kwargs)
@@ -49,13 +147,17 @@ class GroupConsumers(GroupMixin, WebsocketConsumers):
 class SessionMixin(object):
     """
     Add access to the user sessions (http and channels)
+    With `session_cache_timeout` channel session is kept in process memory for the connection
+    instead of loading it from the session store on every message
     """
+    session_cache_timeout = None
 
     @classmethod
     def get_decorators(cls, **kwargs):
         decorators = super(SessionMixin, cls).get_decorators(**kwargs)
         decorators.append(http_session)
-        decorators.append(channel_session)
+        timeout = kwargs.get('session_cache_timeout', cls.session_cache_timeout)
+        decorators.append(cached_channel_session(timeout) if timeout else channel_session)
         return decorators
 
     @property
@@ -67,19 +169,93 @@ class SessionMixin(object):
         return self.message.http_session
 
 
+def permission(cost=0, cache=False):
+    """
+    Decorator for permission callables: checks with lower `cost` run first.
+    With `cache=True` result of the check can be cached by `PermissionMixin`: such check must depend
+    only on the connection, the user and kwargs, never on the message content
+    """
+    def decorator(func):
+        func.cost = cost
+        func.cache = cache
+        return func
+    return decorator
+
+
+def _generation_key(reply_channel=None):
+    return 'cbchannels:permissions:' + (reply_channel or '*')
+
+
+def _get_generations(cache, reply_channel):
+    """
+    Return generations of cached results of the reply channel and of all connections,
+    missing generation (never invalidated or evicted) is started by the new value, so old results are not used
+    """
+    keys = [_generation_key(reply_channel), _generation_key()]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if generations.get(key) is None:
+            cache.add(key, uuid.uuid4().hex, None)
+            generations[key] = cache.get(key)
+    return tuple(generations[key] for key in keys)
+
+
+def invalidate_permissions(reply_channel=None, cache='default'):
+    """
+    Drop cached results of permission checks for the reply channel (name) or for all of them in all processes:
+    generations of results are kept in `cache` django cache, that should be shared by workers
+    """
+    caches[cache].set(_generation_key(reply_channel), uuid.uuid4().hex, None)
+
+
 class PermissionMixin(object):
+    """
+    Check `permissions` before on_receive: cheap ones (see `permission` decorator) first, stop at the first failure.
+    With `permission_cache_timeout` results of checks marked by `permission(cache=True)` are cached in process memory
+    per reply channel, user and kwargs, call `invalidate_permissions` when they can change: it changes generation
+    of the results in `permission_generation_cache` django cache, checked on every message
+    """
     permissions = []
+    permission_cache_timeout = None
+    permission_generation_cache = 'default'
+
+    def _get_permissions(self):
+        return sorted(self.permissions, key=lambda perm: getattr(perm, 'cost', 0))
 
     def _check_permission(self):
-        for perm in self.permissions:
-            if not perm(self):
+        timeout = self.permission_cache_timeout
+        if timeout and self.reply_channel is not None:
+            name = self.reply_channel.name
+            generation = _get_generations(caches[self.permission_generation_cache], name)
+            user = getattr(getattr(self.message, 'user', None), 'pk', None)
+            scope = (name, generation, user, repr(sorted(self.kwargs.items())))
+        else:
+            scope = None
+        for perm in self._get_permissions():
+            if scope is None or not getattr(perm, 'cache', False):
+                allowed = perm(self)
+            else:
+                key = ('permission', perm, scope)
+                allowed = _permissions.get(key)
+                if allowed is None:
+                    allowed = bool(perm(self))
+                    _permissions.set(key, allowed, timeout=timeout)
+            if not allowed:
                 return False
         return True
 
+    def invalidate_permissions(self):
+        invalidate_permissions(self.reply_channel.name, self.permission_generation_cache)
+
     def on_receive(self, *args, **kwargs):
         if self._check_permission():
             super(PermissionMixin, self).on_receive(*args, **kwargs)
 
+    def on_disconnect(self, *args, **kwargs):
+        if self.permission_cache_timeout:
+            self.invalidate_permissions()
+        return super(PermissionMixin, self).on_disconnect(*args, **kwargs)
+
 
 class NoReceiveMixin(object):
     """
@@ -0,0 +1,241 @@
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.db import transaction
+
+try:
+    from django.channels import Group
+except ImportError:
+    from channels import Group
+
+from ..cache import LRUCache
+from ..encoding import default_encoder
+
+TRANSACTION = 'transaction'
+
+_local = threading.local()
+_window_buffers = {}
+_window_buffers_lock = threading.Lock()
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+class EventBuffer(object):
+    """
+    Collects change events per group keeping only the last state of every object
+    and sends them by one message per group at flush
+    """
+
+    def __init__(self):
+        self.groups = OrderedDict()
+        self.encoders = {}
+        self.lock = threading.Lock()
+
+    def add(self, group_name, key, action, data, encoder=default_encoder):
+        with self.lock:
+            self.encoders[group_name] = encoder
+            events = self.groups.setdefault(group_name, OrderedDict())
+            if key in events:
+                action, data = self._merge(events[key], (action, data))
+                if action is None:
+                    del events[key]
+                    return
+            events[key] = (action, data)
+
+    @staticmethod
+    def _merge(previous, current):
+        previous_action, previous_data = previous
+        action, data = current
+        if previous_action == 'created' and action == 'deleted':
+            return None, None
+        if action in ('updated', 'patched'):
+            # updates can carry only changed fields
+            previous_data = json.loads(previous_data)
+            merged = dict(previous_data)
+            merged.update(json.loads(data))
+            if previous_action in ('created', 'updated'):
+                action = previous_action
+            # versioned patches (delta of ObjectSubscribeConsumers) are relative to the first merged one
+            if action != 'patched':
+                merged.pop('_base', None)
+            elif '_base' in previous_data:
+                merged['_base'] = previous_data['_base']
+            return action, json.dumps(merged)
+        return action, data
+
+    def flush(self):
+        with self.lock:
+            groups, self.groups = self.groups, OrderedDict()
+            encoders, self.encoders = self.encoders, {}
+        for group_name, events in groups.items():
+            events = list(events.values())
+            if not events:
+                continue
+            encoder = encoders[group_name]
+            text = encoder.event(*events[0]) if len(events) == 1 else encoder.batch(events)
+            Group(group_name).send({'text': text})
+
+
+class WindowEventBuffer(EventBuffer):
+    """
+    EventBuffer that flushes itself after the time window since the first collected event
+    """
+
+    def __init__(self, window):
+        super(WindowEventBuffer, self).__init__()
+        self.window = window
+        self.timer = None
+
+    def add(self, group_name, key, action, data, encoder=default_encoder):
+        super(WindowEventBuffer, self).add(group_name, key, action, data, encoder)
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.window, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self.timer = None
+        super(WindowEventBuffer, self).flush()
+
+
+def get_transaction_buffer(using=None):
+    """
+    Return buffer flushed at commit of the current transaction or None if there is no transaction
+    """
+    if not hasattr(transaction, 'on_commit'):
+        return None
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        return None
+    buffers = _local.__dict__.setdefault('buffers', {})
+    buffer = buffers.get(connection.alias)
+    # the buffer of rolled back transaction lost its callback
+    if buffer is None or not any(entry[1] == buffer.flush for entry in connection.run_on_commit):
+        buffer = buffers[connection.alias] = EventBuffer()
+        transaction.on_commit(buffer.flush, using=connection.alias)
+    return buffer
+
+
+def get_window_buffer(window):
+    with _window_buffers_lock:
+        if window not in _window_buffers:
+            _window_buffers[window] = WindowEventBuffer(window)
+        return _window_buffers[window]
+
+
+class Throttle(object):
+    """
+    Limits events of every object of a group to `rate` per `interval` seconds. Throttled updates are merged
+    and the result is sent at the end of the interval, created and deleted events are never throttled.
+    Counters and throttled events are kept in the cache: django cache shared by processes or LRUCache
+    """
+
+    UPDATES = ('updated', 'patched')
+
+    def __init__(self, rate, interval, cache):
+        self.rate = rate
+        self.interval = interval
+        self.cache = cache
+
+    @property
+    def timeout(self):
+        # cache backends take whole seconds
+        return max(1, int(math.ceil(self.interval * 2)))
+
+    def _count(self, key):
+        if self.cache.add(key, 1, timeout=self.timeout):
+            return 1
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            return 1
+
+    def allow(self, group_name, key, action, data, encoder=default_encoder):
+        """
+        Return event (action, data) to send now or None if it is throttled.
+        Allowed update is merged with the throttled one, so the older state is not sent after it
+        """
+        slot = hashlib.md5('{}:{}'.format(group_name, key).encode('utf-8')).hexdigest()
+        pending_key = 'cbchannels:throttle:pending:' + slot
+        window = int(time.time() / self.interval)
+        count = self._count('cbchannels:throttle:count:{}:{}'.format(slot, window))
+        if action not in self.UPDATES:
+            self.cache.delete(pending_key)
+            return action, data
+        previous = self.cache.get(pending_key)
+        if previous is not None:
+            action, data = EventBuffer._merge(previous, (action, data))
+        if count <= self.rate:
+            if previous is not None:
+                self.cache.delete(pending_key)
+            return action, data
+        self.cache.set(pending_key, (action, data), timeout=self.timeout)
+        # one process sends the last throttled state of the interval
+        if self.cache.add('cbchannels:throttle:scheduled:{}:{}'.format(slot, window), 1, timeout=self.timeout):
+            timer = threading.Timer((window + 1) * self.interval - time.time(), self.flush,
+                                    (group_name, pending_key, encoder))
+            timer.daemon = True
+            timer.start()
+        return None
+
+    def flush(self, group_name, pending_key, encoder=default_encoder):
+        event = self.cache.get(pending_key)
+        if event is not None:
+            self.cache.delete(pending_key)
+            Group(group_name).send({'text': encoder.event(*event)})
+
+
+def get_throttle(rate, interval, cache=None):
+    """
+    Return Throttle for `rate` events per `interval` seconds, cache - django cache alias or None for process memory
+    """
+    with _throttles_lock:
+        if (rate, interval, cache) not in _throttles:
+            _throttles[rate, interval, cache] = Throttle(rate, interval, LRUCache() if cache is None else caches[cache])
+        return _throttles[rate, interval, cache]
+
+
+@contextmanager
+def coalesce_events(coalesce=TRANSACTION):
+    """
+    Coalesce events sent in the context by this thread, if their senders have no coalesce setting
+    """
+    previous = getattr(_local, 'coalesce', None)
+    _local.coalesce = coalesce
+    try:
+        yield
+    finally:
+        _local.coalesce = previous
+
+
+def send_event(group_name, action, data, key=None, coalesce=None, using=None, encoder=default_encoder, throttle=None):
+    """
+    Send change event to the group.
+    With coalesce (`'transaction'` or time window in seconds) events are buffered and sent
+    by one message per group: single event as is or `{"action": "batch", "data": [events]}`.
+    With throttle (Throttle) frequent updates of an object are delayed and merged
+    """
+    if throttle is not None:
+        event = throttle.allow(group_name, key, action, data, encoder)
+        if event is None:
+            return
+        action, data = event
+    buffer = None
+    coalesce = coalesce or getattr(_local, 'coalesce', None)
+    if coalesce == TRANSACTION:
+        buffer = get_transaction_buffer(using)
+    elif coalesce:
+        buffer = get_window_buffer(coalesce)
+
+    if buffer is None:
+        Group(group_name).send({'text': encoder.event(action, data)})
+    else:
+        buffer.add(group_name, key, action, data, encoder)
@@ -1,25 +1,45 @@
-import json
 import copy
 import hashlib
+import json
+import logging
+import uuid
 from functools import partial
-
-from django.db.models.signals import post_save, post_delete
+from itertools import islice
+
+import django
+import six
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections, router, transaction
+from django.db.models import DateField, DateTimeField, Field, TimeField
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
+from django.core.cache import caches
 from django.core.paginator import InvalidPage, Paginator
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext as _
 
 try:
-    from django.channels import Group
+    from django.channels import Channel
 except ImportError:
-    from channels import Group
+    from channels import Channel
 
 from ..base import WebsocketConsumers, consumer
+from ..cache import LRUCache, instance_cache
 from ..exceptions import ConsumerError
 from .base import NoReceiveMixin, GroupConsumers
+from .broadcast import coalesce_events, get_throttle, send_event
+from .pagination import CachedCountPaginator, CursorPaginator, InvalidCursor, get_count_cache
+from .predicates import QuerysetPredicate
 from .serializers import SimpleSerializer
 
 
+logger = logging.getLogger('cbchannels.deferred')
+
+_snapshots = LRUCache(maxsize=4096)
+_deferred_handlers = {}
+
+
 def _md5(message):
     """
     Calculate md5 hash of message
@@ -29,14 +49,141 @@ def _md5(message):
     return md5.hexdigest()
 
 
+def _iterate(queryset, chunk_size):
+    """
+    Iterate queryset without caching results, fetching rows by chunks where supported
+    """
+    if not hasattr(queryset, 'iterator'):
+        return iter(queryset)
+    if django.VERSION >= (2, 0):
+        return queryset.iterator(chunk_size=chunk_size)
+    return queryset.iterator()
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _freeze(value):
+    """
+    Return hashable representation of serializer kwargs value,
+    collections of fields are compared regardless of the order
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(_freeze(item) for item in value))
+    return value
+
+
+def _changed_fields(instance, data):
+    """
+    Return names from data of concrete fields which values differ from the instance ones,
+    None if data has names of other attributes
+    """
+    changed = []
+    for name, value in data.items():
+        try:
+            field = instance._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.many_to_many:
+            return None
+        try:
+            if field.to_python(value) == getattr(instance, field.attname):
+                continue
+        except ValidationError:
+            pass
+        changed.append(name)
+    return changed
+
+
+_default_pre_save = set(six.get_unbound_function(field_class.pre_save)
+                        for field_class in (Field, DateField, DateTimeField, TimeField))
+
+
+def _pre_save_fields(model):
+    """
+    Return concrete fields which values are set at save by pre_save (auto_now timestamps, custom fields),
+    they should be written with any change of the object
+    """
+    return [field for field in model._meta.concrete_fields if not field.primary_key and (
+        getattr(field, 'auto_now', False) or six.get_unbound_function(type(field).pre_save) not in _default_pre_save)]
+
+
+def _with_pre_save_fields(model, fields):
+    """
+    Return changed field names completed by names of fields set by pre_save
+    """
+    return list(fields) + [field.name for field in _pre_save_fields(model) if field.name not in fields]
+
+
+def _bulk_create(model, objects, using, batch_size=None):
+    """
+    Insert objects by bulk_create and send pre_save and post_save for them,
+    by save() if there are receivers of post_save but the backend can not return primary keys of inserted rows
+    """
+    features = connections[using].features
+    if post_save.has_listeners(model) and not (getattr(features, 'can_return_ids_from_bulk_insert', False) or
+                                               getattr(features, 'can_return_rows_from_bulk_insert', False)):
+        for obj in objects:
+            obj.save(force_insert=True, using=using)
+        return objects
+    for obj in objects:
+        pre_save.send(sender=model, instance=obj, raw=False, using=using, update_fields=None)
+    objects = model._default_manager.db_manager(using).bulk_create(objects, batch_size=batch_size)
+    for obj in objects:
+        post_save.send(sender=model, instance=obj, created=True, update_fields=None, raw=False, using=using)
+    return objects
+
+
+def _bulk_update(model, changes, using, batch_size=None):
+    """
+    Update objects by bulk_update (save() before django 2.2) and send pre_save and post_save for them,
+    changes - list of (object, changed field names)
+    """
+    manager = model._default_manager.db_manager(using)
+    changes = [(obj, _with_pre_save_fields(model, obj_fields)) for obj, obj_fields in changes]
+    if not hasattr(manager, 'bulk_update'):
+        for obj, fields in changes:
+            obj.save(update_fields=fields, using=using)
+        return
+    pre_save_fields = _pre_save_fields(model)
+    for obj, obj_fields in changes:
+        pre_save.send(sender=model, instance=obj, raw=False, using=using, update_fields=frozenset(obj_fields))
+        # bulk_update does not call pre_save of fields
+        for field in pre_save_fields:
+            setattr(obj, field.attname, field.pre_save(obj, False))
+    fields = set(field for obj, obj_fields in changes for field in obj_fields)
+    manager.bulk_update([obj for obj, obj_fields in changes], sorted(fields), batch_size=batch_size)
+    for obj, obj_fields in changes:
+        post_save.send(sender=model, instance=obj, created=False, update_fields=frozenset(obj_fields),
+                       raw=False, using=using)
+
+
+def _clear_serialized(sender, instance, **kwargs):
+    """
+    Drop serialized data of the instance cached by subscriptions at previous save
+    """
+    instance.__dict__.pop('_serialized', None)
+
+
 class SingleObjectMixin(object):
     """
     Mixin Provides the ability to retrieve a single object for further manipulation.
+    With `instance_cache_timeout` the object is cached in process memory (per reply channel
+    with `instance_cache_per_connection`) until it is saved or deleted, objects to change are never taken from it
     """
     model = None
     queryset = None
     slug_field = 'pk'
     slug_path_kwarg = 'pk'
+    instance_cache_timeout = None
+    instance_cache_per_connection = False
     _channel_name_template = '{cls.__name__}.{model.__module__}_{model.__name__}_{slug_field}'
 
     @classmethod
@@ -54,19 +201,36 @@ class SingleObjectMixin(object):
         return cls.channel_name or t.format(model=model, slug_field=kwargs.get('slug_field', cls.slug_field), cls=cls)
 
     def get_queryset(self):
-        return self.queryset or self.model._default_manager.all()
+        if self.queryset is not None:
+            return self.queryset.all()
+        return self.model._default_manager.all()
 
-    @cached_property
-    def instance(self):
+    def _get_instance(self, cached=True):
         queryset = self.get_queryset()
         slug = self.kwargs.get(self.slug_path_kwarg)
 
         queryset = queryset.filter(**{self.slug_field: slug})
         try:
+            if cached and self.instance_cache_timeout:
+                scope = getattr(self.reply_channel, 'name', None) if self.instance_cache_per_connection else None
+                return instance_cache.get(queryset, scope, self.instance_cache_timeout)
             return queryset.get()
         except queryset.model.DoesNotExist:
             return
 
+    @cached_property
+    def instance(self):
+        return self._get_instance()
+
+    @cached_property
+    def instance_for_write(self):
+        """
+        Object to change: always loaded from the database, cached copy could be changed by other processes
+        """
+        if not self.instance_cache_timeout:
+            return self.instance
+        return self._get_instance(cached=False)
+
 
 class SerializerMixin(object):
     """
@@ -83,14 +247,161 @@ class SerializerMixin(object):
         return self.serializer_class(**kwargs)
 
 
-class ObjectSubscribeConsumers(NoReceiveMixin, SingleObjectMixin, GroupConsumers):
+class SubscribeMixin(object):
     """
-    Consumers collection which Provides the ability to subscribe for object changes
+    Mixin Provides sending of model changes to the group of subscribers
+    With `throttle = (rate, interval)` updates of every object are sent not more than `rate` times
+    per `interval` seconds (counted in `throttle_cache` django cache or in process memory),
+    the last state is sent at the end of the interval.
+    With `deferred` saves are handled by workers: signal handler only sends model, pk and update_fields
+    to the internal channel after commit, object is loaded, checked, serialized and sent to the group by its consumer
     """
     serializer_class = SimpleSerializer
     serializer_kwargs = {}
-    _group_name = '{instance.__module__}_{instance.__class__.__name__}_{slug_field}_{uid}'
+    coalesce = None
+    throttle = None
+    throttle_cache = None
+    deferred = False
     _uid = None
+    _signals = ((post_save, '_post_save'), (post_delete, '_post_delete'))
+
+    @classmethod
+    def _get_model(cls, **kwargs):
+        if 'queryset' in kwargs:
+            return kwargs['queryset'].model
+        return kwargs.get('model') or cls.model or cls.queryset.model
+
+    @classmethod
+    def _connect_signals(cls, model, kwargs, **handler_kwargs):
+        """
+        Connect model signals to the class handlers with the given routes kwargs
+        and handler_kwargs that are not passed to the routes
+        """
+        dispatch_uid = _md5(str(cls) + str(kwargs))
+        kwargs['_uid'] = dispatch_uid
+        handler_kwargs.update(kwargs)
+        for signal in (pre_save, pre_delete):
+            signal.connect(_clear_serialized, sender=model, weak=False, dispatch_uid='cbchannels_serialized')
+        for signal, handler in cls._signals:
+            handler = partial(getattr(cls, handler), **handler_kwargs)
+            if signal is post_save and cls._get_setting('deferred', kwargs):
+                _deferred_handlers[dispatch_uid] = handler
+                handler = partial(cls._defer, **kwargs)
+            receiver(signal, sender=model, weak=False, dispatch_uid=dispatch_uid)(handler)
+
+    @classmethod
+    def _defer(cls, sender, instance, created, update_fields, _uid, using=None, **kwargs):
+        """
+        Send saved object reference to the internal channel at commit
+        """
+        opts = sender._meta
+        content = {
+            '_uid': _uid,
+            'model': '%s.%s' % (opts.app_label, opts.model_name),
+            'pk': opts.pk.value_to_string(instance),
+            'created': created,
+            'update_fields': sorted(update_fields) if update_fields else None,
+            'using': using,
+        }
+        channel = Channel(cls._get_channel_name(**kwargs))
+        if hasattr(transaction, 'on_commit'):
+            transaction.on_commit(lambda: channel.send(content), using=using)
+        else:
+            channel.send(content)
+
+    @classmethod
+    def _get_route_specs(cls, **kwargs):
+        specs = super(SubscribeMixin, cls)._get_route_specs(**kwargs)
+        if cls._get_setting('deferred', kwargs):
+            return specs
+        return tuple(spec for spec in specs if spec.consumer.__name__ != 'dispatch_deferred')
+
+    @classmethod
+    def _get_uid_filter(cls, **kwargs):
+        return '^{}$'.format(kwargs.get('_uid', cls._uid))
+
+    @consumer(_uid=_get_uid_filter)
+    def dispatch_deferred(self, message, **kwargs):
+        """
+        Handle save deferred by `_defer`
+        """
+        content = message.content
+        handler = _deferred_handlers.get(self._uid)
+        if handler is None:
+            # routes of the subscription were not built by this process
+            logger.warning('No handler of deferred saves of %s for %s', content['model'], self._uid)
+            return
+        model = apps.get_model(content['model'])
+        pk = model._meta.pk.to_python(content['pk'])
+        instance = model._default_manager.using(content['using']).filter(pk=pk).first()
+        if instance is None:
+            # deleted after save
+            return
+        update_fields = frozenset(content['update_fields']) if content['update_fields'] else None
+        handler(sender=model, instance=instance, created=content['created'],
+                update_fields=update_fields, raw=False, using=content['using'])
+
+    @classmethod
+    def _get_setting(cls, name, kwargs):
+        return kwargs.get(name, getattr(cls, name))
+
+    @classmethod
+    def _get_event_serializer_kwargs(cls, update_fields=None, **kwargs):
+        serializer_kwargs = dict(cls.serializer_kwargs)
+        serializer_kwargs.update(kwargs.get('serializer_kwargs', {}))
+        if 'fields' in serializer_kwargs and update_fields:
+            serializer_kwargs['fields'] = set(serializer_kwargs['fields']).intersection(update_fields) or ['_']
+        return serializer_kwargs
+
+    @classmethod
+    def _serialize(cls, instance, serializer_kwargs):
+        """
+        Serialize instance once per save for all subscriptions with the same serializer and kwargs
+        """
+        try:
+            key = (cls.serializer_class, _freeze(serializer_kwargs))
+            hash(key)
+        except TypeError:
+            return cls.serializer_class(instance, **serializer_kwargs).data
+        cache = instance.__dict__.setdefault('_serialized', {})
+        if key not in cache:
+            cache[key] = cls.serializer_class(instance, **serializer_kwargs).data
+        return cache[key]
+
+    @classmethod
+    def _get_throttle(cls, kwargs):
+        throttle = cls._get_setting('throttle', kwargs)
+        if not throttle:
+            return None
+        return get_throttle(throttle[0], throttle[1], cls._get_setting('throttle_cache', kwargs))
+
+    @classmethod
+    def _send_event(cls, group_name, action, instance, update_fields=None, **kwargs):
+        """
+        Serialize instance and send change event to the group
+        """
+        serializer_kwargs = cls._get_event_serializer_kwargs(update_fields, **kwargs)
+        _model_data = cls._serialize(instance, serializer_kwargs)
+        if _model_data:
+            send_event(group_name, action, _model_data, key=instance.pk, coalesce=cls._get_setting('coalesce', kwargs),
+                       using=kwargs.get('using'), encoder=cls.encoder, throttle=cls._get_throttle(kwargs))
+
+
+class ObjectSubscribeConsumers(SubscribeMixin, NoReceiveMixin, SingleObjectMixin, GroupConsumers):
+    """
+    Consumers collection which Provides the ability to subscribe for object changes
+    With `delta` updates are sent as `patched` action with changed keys only (JSON merge patch)
+    against the last sent state of the group, kept in `delta_cache` django cache ('default') that should be shared
+    by workers (with `delta_cache = None` in process memory, only for a single process).
+    Every event carries `_version` of the state, patches carry `_base` - version they are relative to:
+    a client that has another version missed an event (or the state was changed by another process)
+    and should reconnect to get the full state. Every `delta_resync` update the full state is sent,
+    new subscribers get it at connect
+    """
+    _group_name = '{instance.__module__}_{instance.__class__.__name__}_{slug_field}_{uid}'
+    delta = False
+    delta_cache = 'default'
+    delta_resync = 100
 
     def get_group_name(self, **kwargs):
         return self.get_group_name_for_instance(
@@ -104,43 +415,101 @@ class ObjectSubscribeConsumers(NoReceiveMixin, SingleObjectMixin, GroupConsumers
 
     @classmethod
     def as_routes(cls, **kwargs):
-        if 'queryset' in kwargs:
-            model = kwargs['queryset'].model
-        else:
-            model = kwargs.get('model') or cls.model or cls.queryset.model
-        dispatch_uid = _md5(str(cls) + str(kwargs))
-        kwargs['_uid'] = dispatch_uid
-        receiver(post_save, sender=model, weak=False, dispatch_uid=dispatch_uid)(partial(cls._post_save, **kwargs))
-        receiver(post_delete, sender=model, weak=False, dispatch_uid=dispatch_uid)(partial(cls._post_delete, **kwargs))
+        cls._connect_signals(cls._get_model(**kwargs), kwargs)
         return super(ObjectSubscribeConsumers, cls).as_routes(**kwargs)
 
+    def on_connect(self, message, **kwargs):
+        super(ObjectSubscribeConsumers, self).on_connect(message, **kwargs)
+        if not self.delta:
+            return
+        # patches are relative to the state sent before, so the new subscriber needs the current one,
+        # read after joining the group: changes made since then are sent to the group
+        instance = self.get_queryset().filter(**{self.slug_field: self.kwargs.get(self.slug_path_kwarg)}).first()
+        if instance is None:
+            return
+        data = self._serialize(instance, self._get_event_serializer_kwargs(serializer_kwargs=self.serializer_kwargs))
+        if not data:
+            return
+        group_name = self.get_group_name_for_instance(instance, self._uid)
+        snapshots, key = self._get_snapshots(self._init_kwargs), self._snapshot_key(group_name)
+        state, snapshot = json.loads(data), snapshots.get(key)
+        if snapshot is not None and snapshot[0] == state:
+            self.reply_channel.send({'text': self.encoder.event('updated', self._versioned(state, snapshot[2]))})
+        else:
+            # the group could miss the state too
+            self._send_full(group_name, 'updated', instance, state, snapshots, key, **self._init_kwargs)
+
     @classmethod
-    def _post_save(cls, sender, instance, created, update_fields, _uid, **kwargs):
-        serializer_kwargs = copy.deepcopy(cls.serializer_kwargs)
-        serializer_kwargs.update(kwargs.get('serializer_kwargs', {}))
-        if 'fields' in serializer_kwargs and update_fields:
-            serializer_kwargs['fields'] = set(serializer_kwargs['fields']).intersection(update_fields) or ['_']
+    def _get_snapshots(cls, kwargs):
+        alias = cls._get_setting('delta_cache', kwargs)
+        return _snapshots if alias is None else caches[alias]
 
-        _model_data = cls.serializer_class(instance, **serializer_kwargs).data
-        if _model_data:
-            data = {'text': json.dumps({'action': 'created' if created else 'updated', 'data': None}
-                                       ).replace('null', _model_data)}
-            Group(cls.get_group_name_for_instance(instance, uid=_uid)).send(data)
+    @staticmethod
+    def _snapshot_key(group_name):
+        return 'cbchannels:snapshot:' + _md5(group_name)
 
     @classmethod
-    def _post_delete(cls, sender, instance, _uid, **kwargs):
-        serializer_kwargs = copy.deepcopy(cls.serializer_kwargs)
-        serializer_kwargs.update(kwargs.get('serializer_kwargs', {}))
+    def _versioned(cls, data, version, base=None):
+        data = dict(data, _version=version)
+        if base is not None:
+            data['_base'] = base
+        return cls.encoder.dumps(data)
 
-        _model_data = cls.serializer_class(instance, **serializer_kwargs).data
-        if _model_data:
-            data = {'text': json.dumps({'action': 'deleted', 'data': None}).replace('null', _model_data)}
-            Group(cls.get_group_name_for_instance(instance, uid=_uid)).send(data)
+    @classmethod
+    def _send_full(cls, group_name, action, instance, state, snapshots, key, **kwargs):
+        version = uuid.uuid4().hex
+        snapshots.set(key, (state, 0, version))
+        send_event(group_name, action, cls._versioned(state, version), key=instance.pk,
+                   coalesce=cls._get_setting('coalesce', kwargs), using=kwargs.get('using'),
+                   encoder=cls.encoder, throttle=cls._get_throttle(kwargs))
+
+    @classmethod
+    def _send_delta(cls, group_name, action, instance, **kwargs):
+        """
+        Send updated object as patch against the last sent state of the group.
+        Full state is sent if there is no such state, it is time to resync or the state does not differ
+        from the sent one (it could be changed by another process since then)
+        """
+        data = cls._serialize(instance, cls._get_event_serializer_kwargs(**kwargs))
+        if not data:
+            return
+        snapshots, key = cls._get_snapshots(kwargs), cls._snapshot_key(group_name)
+        state, snapshot = json.loads(data), snapshots.get(key)
+        resync = cls._get_setting('delta_resync', kwargs)
+        if action == 'updated' and snapshot is not None:
+            previous, count, base = snapshot
+            patch = dict((name, value) for name, value in state.items() if name not in previous or previous[name] != value)
+            patch.update((name, None) for name in previous if name not in state)
+            if patch and (not resync or count < resync):
+                version = uuid.uuid4().hex
+                snapshots.set(key, (state, count + 1, version))
+                send_event(group_name, 'patched', cls._versioned(patch, version, base), key=instance.pk,
+                           coalesce=cls._get_setting('coalesce', kwargs), using=kwargs.get('using'),
+                           encoder=cls.encoder, throttle=cls._get_throttle(kwargs))
+                return
+        cls._send_full(group_name, action, instance, state, snapshots, key, **kwargs)
+
+    @classmethod
+    def _post_save(cls, sender, instance, created, update_fields, _uid, **kwargs):
+        group_name = cls.get_group_name_for_instance(instance, uid=_uid)
+        if cls._get_setting('delta', kwargs):
+            return cls._send_delta(group_name, 'created' if created else 'updated', instance, **kwargs)
+        cls._send_event(group_name, 'created' if created else 'updated', instance, update_fields, **kwargs)
+
+    @classmethod
+    def _post_delete(cls, sender, instance, _uid, **kwargs):
+        group_name = cls.get_group_name_for_instance(instance, uid=_uid)
+        if cls._get_setting('delta', kwargs):
+            cls._get_snapshots(kwargs).delete(cls._snapshot_key(group_name))
+        cls._send_event(group_name, 'deleted', instance, **kwargs)
 
 
 class MultipleObjectMixin(object):
     """
     Mixin Provides the ability to retrieve collection of objects for further manipulation
+    With `paginator_class = CursorPaginator` pages are requested by `cursor` from the previous page.
+    With `count_cache_timeout` COUNT of the queryset is cached (by `count_cache` django cache alias
+    or in process memory) until changes of the tables
     """
     queryset = None
     model = None
@@ -149,13 +518,38 @@ class MultipleObjectMixin(object):
     context_object_name = None
     paginator_class = Paginator
     page_kwarg = 'page'
+    cursor_kwarg = 'cursor'
+    count_cache = None
+    count_cache_timeout = None
 
     def get_queryset(self):
-        return self.queryset or self.model._default_manager.all()
+        if self.queryset is not None:
+            return self.queryset.all()
+        return self.model._default_manager.all()
+
+    @classmethod
+    def as_routes(cls, **kwargs):
+        if kwargs.get('count_cache_timeout', cls.count_cache_timeout):
+            # changes made by processes that have not counted yet should invalidate counts too
+            queryset = kwargs.get('queryset', cls.queryset)
+            model = queryset.model if queryset is not None else kwargs.get('model', cls.model)
+            get_count_cache(kwargs.get('count_cache', cls.count_cache)).watch(model)
+        return super(MultipleObjectMixin, cls).as_routes(**kwargs)
+
+    def get_paginator(self, queryset):
+        paginator_class = self.paginator_class
+        if self.count_cache_timeout and paginator_class is Paginator:
+            paginator_class = CachedCountPaginator
+        if self.count_cache_timeout and issubclass(paginator_class, CachedCountPaginator):
+            return paginator_class(queryset, self.paginate_by, self.paginate_orphans,
+                                   count_cache=self.count_cache, count_timeout=self.count_cache_timeout)
+        return paginator_class(queryset, self.paginate_by, self.paginate_orphans)
 
     def paginate_queryset(self):
         queryset = self.get_queryset()
-        paginator = self.paginator_class(queryset, self.paginate_by, self.paginate_orphans)
+        paginator = self.get_paginator(queryset)
+        if isinstance(paginator, CursorPaginator):
+            return self.paginate_queryset_by_cursor(paginator)
         page = self.message.content.get(self.page_kwarg, 1)
         try:
             page_number = int(page)
@@ -173,15 +567,23 @@ class MultipleObjectMixin(object):
                 'message': str(e)
             })
 
+    def paginate_queryset_by_cursor(self, paginator):
+        try:
+            page = paginator.page(self.message.content.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise ConsumerError(_('Invalid cursor'))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
 
-class ModelSubscribeConsumers(NoReceiveMixin, SingleObjectMixin, GroupConsumers):
+class ModelSubscribeConsumers(SubscribeMixin, NoReceiveMixin, SingleObjectMixin, GroupConsumers):
     """
     Consumers collection which Provides the ability to subscribe for models updates ()
+    With `in_memory_filter` simple queryset filters are checked against saved instance without a query,
+    otherwise every save and every deleted row of the model costs one query per subscription
     """
-    serializer_class = SimpleSerializer
-    serializer_kwargs = {}
     _group_name = '{m.__module__}.{m.__name__}.{uid}'
-    _uid = None
+    in_memory_filter = False
+    _signals = SubscribeMixin._signals + ((pre_delete, '_pre_delete'),)
 
     @classmethod
     def get_group_name_for_model(cls, model, uid):
@@ -192,43 +594,42 @@ class ModelSubscribeConsumers(NoReceiveMixin, SingleObjectMixin, GroupConsumers)
 
     @classmethod
     def as_routes(cls, **kwargs):
-        if 'queryset' in kwargs:
-            model = kwargs['queryset'].model
-        else:
-            model = kwargs.get('model', None) or cls.model or cls.queryset.model
-        dispatch_uid = _md5(str(cls) + str(kwargs))
-        kwargs['_uid'] = dispatch_uid
-        kwargs.setdefault('queryset', cls.queryset)
-        receiver(post_save, sender=model, weak=False, dispatch_uid=dispatch_uid)(partial(cls._post_save, **kwargs))
-        receiver(post_delete, sender=model, weak=False, dispatch_uid=dispatch_uid)(partial(cls._post_delete, **kwargs))
+        queryset = cls._get_setting('queryset', kwargs)
+        predicate = None
+        if queryset is not None and cls._get_setting('in_memory_filter', kwargs):
+            predicate = QuerysetPredicate.compile(queryset)
+        cls._connect_signals(cls._get_model(**kwargs), kwargs, _predicate=predicate)
         return super(ModelSubscribeConsumers, cls).as_routes(**kwargs)
 
+    @classmethod
+    def _in_queryset(cls, instance, update_fields=None, _predicate=None, **kwargs):
+        queryset = cls._get_setting('queryset', kwargs)
+        if queryset is None:
+            return True
+        if _predicate is not None:
+            matches = _predicate.matches(instance, update_fields)
+            if matches is not None:
+                return matches
+        return queryset.filter(pk=instance.pk).exists()
+
     @classmethod
     def _post_save(cls, sender, instance, created, update_fields, _uid, **kwargs):
-        if kwargs.get('queryset'):
-            if not kwargs['queryset'].filter(pk=instance.pk).exists():
-                return
-        serializer_kwargs = copy.deepcopy(cls.serializer_kwargs)
-        serializer_kwargs.update(kwargs.get('serializer_kwargs', {}))
-        if 'fields' in serializer_kwargs and update_fields:
-            serializer_kwargs['fields'] = set(serializer_kwargs['fields']).intersection(update_fields) or ['_']
+        if not cls._in_queryset(instance, update_fields, **kwargs):
+            return
+        cls._send_event(cls.get_group_name_for_model(sender, _uid), 'created' if created else 'updated',
+                        instance, update_fields, **kwargs)
 
-        _model_data = cls.serializer_class(instance, **serializer_kwargs).data
-        if _model_data:
-            data = {'text': json.dumps({'action': 'created' if created else 'updated', 'data': None
-                                        }).replace('null', _model_data)}
-            Group(cls.get_group_name_for_model(sender, _uid)).send(data)
+    @classmethod
+    def _pre_delete(cls, sender, instance, _uid, **kwargs):
+        # row still exists, so queryset can be checked by the query if needed:
+        # one query per deleted row, bulk deletes are not checked by one query
+        instance.__dict__.setdefault('_in_subscription', {})[_uid] = cls._in_queryset(instance, **kwargs)
 
     @classmethod
     def _post_delete(cls, sender, instance, _uid, **kwargs):
-        # TODO: how to filter by queryset?
-        serializer_kwargs = copy.deepcopy(cls.serializer_kwargs)
-        serializer_kwargs.update(kwargs.get('serializer_kwargs', {}))
-
-        _model_data = cls.serializer_class(instance, **serializer_kwargs).data
-        if _model_data:
-            data = {'text': json.dumps({'action': 'deleted', 'data': None}).replace('null', _model_data)}
-            Group(cls.get_group_name_for_model(sender, _uid)).send(data)
+        if not instance.__dict__.get('_in_subscription', {}).pop(_uid, True):
+            return
+        cls._send_event(cls.get_group_name_for_model(sender, _uid), 'deleted', instance, **kwargs)
 
 
 class CreateMixin(object):
@@ -268,18 +669,25 @@ class GetMixin(object):
 class UpdateMixin(object):
     """
     Mixin - Adds the consumer that update object.
+    Only changed fields (and fields set at save, like `auto_now` ones) are saved,
+    nothing is written if there are no changes.
     Using with SerializerMixin and SingleObjectMixin
     """
     UPDATE = 'update'
 
     @consumer(action=UPDATE)
     def update(self, message):
-        serializer = self.get_serializer(instance=self.instance, data=message.content['data'])
+        instance = self.instance_for_write
+        serializer = self.get_serializer(instance=instance, data=message.content['data'])
         if serializer.is_valid():
-            instance = self.instance
-            for field, value in serializer.validated_data.items():
-                setattr(instance, field, value)
-            instance.save()
+            data = serializer.validated_data
+            fields = _changed_fields(instance, data)
+            for field in data if fields is None else fields:
+                setattr(instance, field, data[field])
+            if fields is None:
+                instance.save()
+            elif fields:
+                instance.save(update_fields=_with_pre_save_fields(type(instance), fields))
             self.on_update(message)
 
     def on_update(self, message):
@@ -295,7 +703,7 @@ class DeleteMixin(object):
 
     @consumer(action=DELETE)
     def delete(self, message):
-        self.instance.delete()
+        self.instance_for_write.delete()
         self.on_delete(message)
 
     def on_delete(self, message):
@@ -305,19 +713,148 @@ class DeleteMixin(object):
 class ListMixin(object):
     """
     Mixin - Adds consumer for return list of objects
+    With `stream_chunk_size` list is sent by several frames
     """
     LIST = 'list'
+    stream_chunk_size = None
 
     @consumer(action=LIST)
     def list(self, message):
+        if self.stream_chunk_size:
+            return self.stream_list(message)
         paginator, page, object_list, has_other_pages = self.paginate_queryset()
-        self.reply({'response': self.get_serializer(instance=object_list, many=True).data})
+        response = {'response': self.get_serializer(instance=object_list, many=True).data}
+        if isinstance(paginator, CursorPaginator):
+            response['next'] = page.next_cursor
+        self.reply(response)
+
+    def stream_list(self, message):
+        """
+        Send objects by frames of `stream_chunk_size` objects, reading them from database by chunks:
+        {"stream": "start"}, {"stream": "chunk", "response": <objects>}, ..., {"stream": "end", "count": <count>}
+        With CursorPaginator the end frame carries the cursor of the next page as `next`
+        """
+        end = {'stream': 'end'}
+        if self.paginate_by:
+            paginator, page, object_list, has_other_pages = self.paginate_queryset()
+            if isinstance(paginator, CursorPaginator):
+                end['next'] = page.next_cursor
+        else:
+            object_list = self.get_queryset()
+        self.reply({'stream': 'start'})
+        count = 0
+        for chunk in _chunks(_iterate(object_list, self.stream_chunk_size), self.stream_chunk_size):
+            self.reply({'stream': 'chunk', 'response': self.get_serializer(instance=chunk, many=True).data})
+            count += len(chunk)
+        end['count'] = count
+        self.reply(end)
+
+
+class BulkMixin(object):
+    """
+    Mixin - Adds consumers that create, update and delete several objects by one message in one transaction.
+    Change events of subscriptions are coalesced and sent after commit.
+    `data` is a list of objects (with primary key `pk` for update) or a list of primary keys for delete.
+    Using with SerializerMixin and MultipleObjectMixin
+    """
+    BULK_CREATE = 'bulk_create'
+    BULK_UPDATE = 'bulk_update'
+    BULK_DELETE = 'bulk_delete'
+    bulk_batch_size = None
+
+    @staticmethod
+    def _to_pk(model, value):
+        try:
+            return model._meta.pk.to_python(value)
+        except ValidationError:
+            raise ConsumerError(_('Invalid primary key: %(pk)s') % {'pk': value})
+
+    @staticmethod
+    def _check_objects(data):
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise ConsumerError(_('Data should be a list of objects'))
+
+    @staticmethod
+    def _check_fields(model, item):
+        opts = model._meta
+        unknown = set(item) - set(f.name for f in opts.concrete_fields) - set(f.attname for f in opts.concrete_fields)
+        if unknown:
+            raise ConsumerError(_('Unknown fields: %(fields)s') % {'fields': ', '.join(sorted(unknown))})
+
+    @consumer(action=BULK_CREATE)
+    def bulk_create(self, message):
+        serializer = self.get_serializer(data=message.content['data'], many=True)
+        if serializer.is_valid():
+            self._check_objects(serializer.validated_data)
+            model = self.get_queryset().model
+            for item in serializer.validated_data:
+                self._check_fields(model, item)
+            using = router.db_for_write(model)
+            with transaction.atomic(using=using), coalesce_events():
+                objects = _bulk_create(model, [model(**item) for item in serializer.validated_data],
+                                       using, self.bulk_batch_size)
+            self.on_bulk_create(message, objects)
+
+    def on_bulk_create(self, message, objects):
+        self.reply({'response': 'ok'})
+
+    @consumer(action=BULK_UPDATE)
+    def bulk_update(self, message):
+        serializer = self.get_serializer(data=message.content['data'], many=True)
+        if serializer.is_valid():
+            self._check_objects(serializer.validated_data)
+            queryset = self.get_queryset()
+            opts = queryset.model._meta
+            data = {}
+            for item in serializer.validated_data:
+                item = dict(item)
+                pk = self._to_pk(queryset.model, item.pop('pk', item.pop(opts.pk.name, None)))
+                self._check_fields(queryset.model, item)
+                data.setdefault(pk, {}).update(item)
+
+            using = router.db_for_write(queryset.model)
+            with transaction.atomic(using=using), coalesce_events():
+                objects = queryset.using(using).select_for_update().in_bulk(list(data))
+                missing = set(data) - set(objects)
+                if missing:
+                    raise ConsumerError(_('Objects not found: %(pks)s') % {
+                        'pks': ', '.join(sorted(str(pk) for pk in missing))
+                    })
+                changes = []
+                for pk, values in data.items():
+                    fields = _changed_fields(objects[pk], values)
+                    for field in fields:
+                        setattr(objects[pk], field, values[field])
+                    if fields:
+                        changes.append((objects[pk], fields))
+                _bulk_update(queryset.model, changes, using, self.bulk_batch_size)
+            self.on_bulk_update(message, [obj for obj, fields in changes])
+
+    def on_bulk_update(self, message, objects):
+        self.reply({'response': 'ok'})
+
+    @consumer(action=BULK_DELETE)
+    def bulk_delete(self, message):
+        serializer = self.get_serializer(data=message.content['data'], many=True)
+        if serializer.is_valid():
+            if not isinstance(serializer.validated_data, list):
+                raise ConsumerError(_('Data should be a list of primary keys'))
+            queryset = self.get_queryset()
+            pks = [self._to_pk(queryset.model, pk) for pk in serializer.validated_data]
+            using = router.db_for_write(queryset.model)
+            with transaction.atomic(using=using), coalesce_events():
+                queryset.using(using).filter(pk__in=pks).delete()
+            self.on_bulk_delete(message, pks)
+
+    def on_bulk_delete(self, message, pks):
+        self.reply({'response': 'ok'})
 
 
-class CRUDConsumers(CreateMixin, GetMixin, UpdateMixin, DeleteMixin, ListMixin, SerializerMixin,
+class CRUDConsumers(CreateMixin, GetMixin, UpdateMixin, DeleteMixin, ListMixin, BulkMixin, SerializerMixin,
                     SingleObjectMixin, MultipleObjectMixin, WebsocketConsumers):
     """
     Consumers collection - Provides base methods for object manipulations Create, Read, List, Update and Delete
+    and bulk actions
     """
 
     @classmethod
@@ -0,0 +1,220 @@
+import base64
+import hashlib
+import json
+import operator
+import threading
+import time
+from functools import reduce
+
+from django.apps import apps
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.utils.functional import cached_property
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+from ..cache import LRUCache
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class CursorPage(object):
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next()
+
+
+class CursorPaginator(object):
+    """
+    Paginates queryset by values of ordering fields (keyset pagination), so neither COUNT nor OFFSET is queried.
+    Ordering is taken from queryset or model Meta and completed by primary key,
+    ordering fields should be not null fields of the model itself.
+    Page is requested by opaque cursor, given as `next_cursor` of the previous page
+    """
+
+    def __init__(self, queryset, per_page, orphans=0):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = self._get_ordering(queryset)
+
+    @staticmethod
+    def _get_ordering(queryset):
+        """
+        Return list of (field, descending)
+        """
+        opts = queryset.model._meta
+        names = list(queryset.query.order_by or opts.ordering or [])
+        ordering = []
+        for name in names:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = opts.pk.name
+            if '__' in name or name == '?':
+                raise ValueError('CursorPaginator supports only ordering by fields of the model')
+            ordering.append((opts.get_field(name), descending))
+        if opts.pk not in [field for field, _ in ordering]:
+            ordering.append((opts.pk, False))
+        return ordering
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field.attname) for field, _ in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(values, default=_default).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(cursor).encode()).decode())
+        except (TypeError, ValueError):
+            raise InvalidCursor('Invalid cursor')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise InvalidCursor('Invalid cursor')
+        try:
+            values = [field.to_python(value) for (field, _), value in zip(self.ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidCursor('Invalid cursor')
+        if None in values:
+            raise InvalidCursor('Invalid cursor')
+        return values
+
+    def _after(self, values):
+        """
+        Return filter for objects that follow the object with given ordering values
+        """
+        conditions = []
+        for i, (field, descending) in enumerate(self.ordering):
+            condition = {prev.attname: value for (prev, _), value in zip(self.ordering[:i], values)}
+            condition['{}__{}'.format(field.attname, 'lt' if descending else 'gt')] = values[i]
+            conditions.append(Q(**condition))
+        return reduce(operator.or_, conditions)
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*[('-' if descending else '') + field.attname
+                                            for field, descending in self.ordering])
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+        object_list = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(object_list) > self.per_page:
+            object_list = object_list[:self.per_page]
+            next_cursor = self.encode_cursor(object_list[-1])
+        return CursorPage(object_list, next_cursor)
+
+
+class CountCache(object):
+    """
+    Caches COUNT of querysets by their SQL. Every table has a version that is a part of the key
+    and changed at post_save/post_delete of its model, so counts of changed tables are not used anymore.
+    cache - django cache or LRUCache
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._watched = set()
+        self._tables = set()
+        self._lock = threading.Lock()
+
+    def _version_key(self, table):
+        return 'cbchannels:count:version:{}'.format(table)
+
+    def _version(self, table):
+        version = self.cache.get(self._version_key(table))
+        if version is None:
+            # start from the new value, so counts cached before the version was lost are not used
+            version = int(time.time() * 1000)
+            self.cache.set(self._version_key(table), version, timeout=None)
+        return version
+
+    def invalidate(self, table):
+        try:
+            self.cache.incr(self._version_key(table))
+        except ValueError:
+            self._version(table)
+
+    def _invalidate_model(self, sender, **kwargs):
+        self.invalidate(sender._meta.db_table)
+
+    def watch(self, model):
+        """
+        Invalidate counts of the model table at its changes
+        """
+        with self._lock:
+            if model in self._watched:
+                return
+            self._watched.add(model)
+        uid = 'cbchannels_count_{}'.format(id(self))
+        post_save.connect(self._invalidate_model, sender=model, weak=False, dispatch_uid=uid)
+        post_delete.connect(self._invalidate_model, sender=model, weak=False, dispatch_uid=uid)
+
+    def count(self, queryset, timeout=None):
+        query = queryset.query
+        try:
+            sql, params = query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+        tables = sorted(set(query.alias_map[alias].table_name for alias in query.alias_map) or
+                        [queryset.model._meta.db_table])
+        if not self._tables.issuperset(tables):
+            models = dict((model._meta.db_table, model) for model in apps.get_models(include_auto_created=True))
+            for table in tables:
+                if table in models:
+                    self.watch(models[table])
+            self._tables.update(tables)
+        key = '{}:{}'.format(queryset.db, sql) + repr(params) + repr([self._version(table) for table in tables])
+        key = 'cbchannels:count:' + hashlib.md5(key.encode('utf-8')).hexdigest()
+        count = self.cache.get(key)
+        if count is None:
+            count = queryset.count()
+            self.cache.set(key, count, timeout=timeout)
+        return count
+
+
+_count_caches = {}
+_count_caches_lock = threading.Lock()
+
+
+def get_count_cache(alias=None):
+    """
+    Return CountCache for the django cache alias, with alias None - for process local LRUCache
+    """
+    with _count_caches_lock:
+        if alias not in _count_caches:
+            _count_caches[alias] = CountCache(LRUCache() if alias is None else caches[alias])
+        return _count_caches[alias]
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator that takes COUNT of the object list from CountCache of `count_cache` django cache alias
+    (or process local one), counts are cached for `count_timeout` seconds
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True,
+                 count_cache=None, count_timeout=None):
+        super(CachedCountPaginator, self).__init__(object_list, per_page, orphans, allow_empty_first_page)
+        self.count_cache = count_cache
+        self.count_timeout = count_timeout
+
+    @cached_property
+    def count(self):
+        return get_count_cache(self.count_cache).count(self.object_list, self.count_timeout)
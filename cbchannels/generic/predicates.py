@@ -0,0 +1,157 @@
+import operator
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model
+from django.db.models.expressions import Col
+from django.db.models.lookups import Lookup
+from django.db.models.sql.where import AND, WhereNode
+
+
+def _compare(op):
+    def compare(value, rhs):
+        if value is None or rhs is None:
+            return None
+        return op(value, rhs)
+    return compare
+
+
+def _in(value, rhs):
+    if value is None:
+        return None
+    return value in rhs
+
+
+def _isnull(value, rhs):
+    return (value is None) == bool(rhs)
+
+
+LOOKUPS = {
+    'exact': _compare(operator.eq),
+    'gt': _compare(operator.gt),
+    'gte': _compare(operator.ge),
+    'lt': _compare(operator.lt),
+    'lte': _compare(operator.le),
+    'in': _in,
+    'isnull': _isnull,
+}
+
+
+class CannotEvaluate(Exception):
+    """
+    Queryset filter can not be evaluated without the database
+    """
+
+
+class QuerysetPredicate(object):
+    """
+    Evaluates simple filters of the queryset (field lookups of the model's own table from LOOKUPS)
+    against a model instance without the database. Comparisons follow SQL NULL semantics,
+    instance values are normalized by `field.to_python` first (a string assigned to a DateField and so on).
+    Strings are compared by Python: with case or accent insensitive database collation (MySQL default)
+    results for text fields can differ from the database, do not use in memory filters for them there.
+
+    Usage:
+
+    predicate = QuerysetPredicate.compile(User.objects.filter(is_active=True))
+    if predicate is not None:
+        predicate.matches(user)  # True, False or None if it is undecidable in memory
+    """
+
+    def __init__(self, queryset):
+        query = queryset.query
+        if query.low_mark or query.high_mark is not None or getattr(query, 'combinator', None):
+            raise CannotEvaluate('Sliced or combined queryset')
+        self.model = query.model
+        self.fields = {}
+        self._evaluate = self._compile(query.where)
+
+    @classmethod
+    def compile(cls, queryset):
+        """
+        Return predicate for the queryset or None if it can not be evaluated in memory
+        """
+        try:
+            return cls(queryset)
+        except CannotEvaluate:
+            return None
+
+    def _compile(self, node):
+        if isinstance(node, WhereNode):
+            children = [self._compile(child) for child in node.children]
+            return _node(children, node.connector, node.negated)
+        if isinstance(node, Lookup):
+            return self._compile_lookup(node)
+        raise CannotEvaluate('Unsupported filter {!r}'.format(node))
+
+    def _compile_lookup(self, lookup):
+        if lookup.lookup_name not in LOOKUPS or not isinstance(lookup.lhs, Col):
+            raise CannotEvaluate('Unsupported lookup {!r}'.format(lookup))
+        field = lookup.lhs.target
+        if lookup.lhs.alias != self.model._meta.db_table or field.model._meta.concrete_model != self.model._meta.concrete_model:
+            raise CannotEvaluate('Lookup {!r} requires join'.format(lookup))
+        rhs = _prepare_rhs(lookup.rhs)
+        compare = LOOKUPS[lookup.lookup_name]
+        attname = field.attname
+        self.fields[attname] = field
+
+        def evaluate(instance):
+            return compare(field.to_python(getattr(instance, attname)), rhs)
+        return evaluate
+
+    def can_evaluate(self, instance, update_fields=None):
+        """
+        Check that instance state in memory is the saved state of the filtered fields
+        """
+        if update_fields:
+            for field in self.fields.values():
+                if not field.primary_key and field.name not in update_fields and field.attname not in update_fields:
+                    return False
+        return not instance.get_deferred_fields().intersection(self.fields)
+
+    def matches(self, instance, update_fields=None):
+        """
+        Return True if instance is in the queryset, False if not
+        and None if it can not be checked without the database
+        """
+        if not self.can_evaluate(instance, update_fields):
+            return None
+        try:
+            return self._evaluate(instance) is True
+        except (TypeError, ValidationError):
+            return None
+
+
+def _prepare_rhs(rhs):
+    if hasattr(rhs, 'resolve_expression') or hasattr(rhs, 'query'):
+        raise CannotEvaluate('Expressions and subqueries are not supported')
+    if isinstance(rhs, Model):
+        return rhs.pk
+    if isinstance(rhs, (list, tuple, set, frozenset)):
+        return frozenset(_prepare_rhs(value) for value in rhs)
+    return rhs
+
+
+def _node(children, connector, negated):
+    """
+    Combine children predicates with three-valued logic
+    """
+    def evaluate(instance):
+        result = True if connector == AND else False
+        for child in children:
+            value = child(instance)
+            if connector == AND:
+                if value is False:
+                    result = False
+                    break
+                if value is None:
+                    result = None
+            else:
+                if value is True:
+                    result = True
+                    break
+                if value is None:
+                    result = None
+        if negated and result is not None:
+            return not result
+        return result
+    return evaluate
@@ -1,9 +1,15 @@
 import json
+from itertools import chain
 
 from django.core import serializers
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import ManyToManyField, QuerySet
 from django.forms.models import model_to_dict
 
+from ..encoding import get_dumps
+
+_fields_cache = {}
+
 
 class SimpleSerializer(object):
 
@@ -47,3 +53,98 @@ class DjangoSerializer(SimpleSerializer):
     def is_valid(self):
         self._validated_data = serializers.deserialize(self.kwargs.get('format', 'json'), self.data, **self.kwargs)
         return True
+
+
+def _get_model_fields(model, fields=None, exclude=None):
+    """
+    Return fields of the model serialized by model_to_dict with given fields and exclude, cached
+    """
+    key = (model, frozenset(fields) if fields else None, frozenset(exclude) if exclude else None)
+    if key not in _fields_cache:
+        opts = model._meta
+        private_fields = getattr(opts, 'private_fields', None) or getattr(opts, 'virtual_fields', [])
+        result = []
+        for f in chain(opts.concrete_fields, private_fields, opts.many_to_many):
+            if not getattr(f, 'editable', False):
+                continue
+            if fields and f.name not in fields:
+                continue
+            if exclude and f.name in exclude:
+                continue
+            result.append(f)
+        _fields_cache[key] = result
+    return _fields_cache[key]
+
+
+class CompiledSerializer(SimpleSerializer):
+    """
+    SimpleSerializer with the same output, that finds serialized fields of the model once per fields/exclude,
+    reads querysets by values() and many to many relations by one query per field.
+    Many to many fields are serialized as lists of primary keys.
+    With `json_backend` ('auto', 'orjson', 'ujson') faster JSON library is used,
+    note that it formats datetime values differently from DjangoJSONEncoder
+    """
+    json_backend = None
+
+    def _dumps(self, data):
+        if self.json_backend:
+            try:
+                return get_dumps(self.json_backend)(data)
+            except (TypeError, ValueError):
+                pass
+        return json.dumps(data, cls=DjangoJSONEncoder)
+
+    @property
+    def data(self):
+        if not self._data:
+            if self.many and isinstance(self.instance, QuerySet):
+                data = self._queryset_to_list(self.instance)
+            elif self.many:
+                data = [self._instance_to_dict(instance) for instance in self.instance]
+            else:
+                data = self._instance_to_dict(self.instance)
+            if data:
+                self._data = self._dumps(data)
+        return self._data
+
+    def _get_fields(self, model):
+        return _get_model_fields(model, self.kwargs.get('fields'), self.kwargs.get('exclude'))
+
+    def _instance_to_dict(self, instance):
+        data = {}
+        for f in self._get_fields(instance.__class__):
+            if isinstance(f, ManyToManyField):
+                data[f.name] = [] if instance.pk is None else [obj.pk for obj in getattr(instance, f.attname).all()]
+            else:
+                data[f.name] = f.value_from_object(instance)
+        return data
+
+    def _queryset_to_list(self, queryset):
+        fields = self._get_fields(queryset.model)
+        m2m = [f for f in fields if isinstance(f, ManyToManyField)]
+        names = [f.name for f in fields if not isinstance(f, ManyToManyField)]
+        pk_name = queryset.model._meta.pk.name
+        rows = list(queryset.values(*(names + [pk_name] if m2m and pk_name not in names else names)))
+        if m2m:
+            pks = [row[pk_name] for row in rows]
+            related = {f.name: self._get_related_pks(f, pks) for f in m2m}
+        data = []
+        for row in rows:
+            item = {name: row[name] for name in names}
+            for f in m2m:
+                item[f.name] = related[f.name].get(row[pk_name], [])
+            data.append(item)
+        return data
+
+    @staticmethod
+    def _get_related_pks(field, pks):
+        """
+        Return dict: pk of object -> list of pk of related by many to many field objects
+        """
+        through = (getattr(field, 'remote_field', None) or field.rel).through
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        result = {}
+        for source_pk, target_pk in through._default_manager.filter(**{source + '__in': pks}).values_list(
+                source, target).order_by('pk'):
+            result.setdefault(source_pk, []).append(target_pk)
+        return result
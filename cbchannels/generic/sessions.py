@@ -0,0 +1,87 @@
+import copy
+import functools
+
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.base import CreateError
+
+try:
+    from django.channels.exceptions import ConsumeLater
+    from django.channels.sessions import session_for_reply_channel
+except ImportError:
+    from channels.exceptions import ConsumeLater
+    from channels.sessions import session_for_reply_channel
+
+from ..cache import LRUCache
+
+connections = LRUCache(maxsize=10000)
+
+
+def forget_connection(reply_channel):
+    """
+    Drop cached session data of the connection
+    """
+    connections.delete(('session', reply_channel))
+
+
+def cached_channel_session(timeout):
+    """
+    Like channels `channel_session`, but keeps session data of the connection in process memory
+    for `timeout` seconds or until disconnect. Every message gets a new session store with a copy of the data,
+    changed session is saved to the store at once, changes made by other processes are seen after the timeout
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def inner(message, *args, **kwargs):
+            if hasattr(message, 'channel_session'):
+                return func(message, *args, **kwargs)
+            if not message.reply_channel:
+                raise ValueError('No reply_channel sent to consumer; @channel_session '
+                                 'can only be used on messages containing it.')
+            key = ('session', message.reply_channel.name)
+            cached = connections.get(key)
+            if cached is None:
+                session = session_for_reply_channel(message.reply_channel.name)
+                if not session.exists(session.session_key):
+                    try:
+                        session.save(must_create=True)
+                    except CreateError:
+                        raise ConsumeLater()
+            else:
+                # new store with loaded data, so it is not read again
+                store_class, session_key, data = cached
+                session = store_class(session_key=session_key)
+                session._session_cache = copy.deepcopy(data)
+            message.channel_session = session
+            try:
+                return func(message, *args, **kwargs)
+            finally:
+                if session.modified:
+                    session.save()
+                if cached is None or session.modified:
+                    connections.set(key, (type(session), session.session_key, copy.deepcopy(session._get_session())),
+                                    timeout=timeout)
+                if message.channel.name == 'websocket.disconnect':
+                    forget_connection(message.reply_channel.name)
+        return inner
+    decorator._channel_session = True
+    return decorator
+
+
+def cached_channel_session_user(timeout):
+    """
+    Like channels `channel_session_user` with `cached_channel_session`: user is loaded and checked
+    by `get_user` (session hash, backend) on every message, only the session is cached.
+    Inactive user is anonymous (ModelBackend of Django < 1.10 does not check it)
+    """
+    def decorator(func):
+        @cached_channel_session(timeout)
+        @functools.wraps(func)
+        def inner(message, *args, **kwargs):
+            user = auth.get_user(type('FakeRequest', (object, ), {'session': message.channel_session}))
+            if not getattr(user, 'is_active', True):
+                user = AnonymousUser()
+            message.user = user
+            return func(message, *args, **kwargs)
+        return inner
+    return decorator
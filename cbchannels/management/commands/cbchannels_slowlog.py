@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.core.management import BaseCommand
+
+from cbchannels.slowlog import SlowLog
+
+
+class Command(BaseCommand):
+    help = 'Show slow consumer calls recorded by workers'
+
+    def add_arguments(self, parser):
+        super(Command, self).add_arguments(parser)
+        parser.add_argument('--cache', action='store', dest='cache', default='default',
+                            help='Cache alias of the slow log, if not the default.')
+        parser.add_argument('--limit', action='store', dest='limit', type=int, default=20,
+                            help='Number of the last calls to show.')
+        parser.add_argument('--stacks', action='store_true', dest='stacks', default=False,
+                            help='Show sampled stacks of the calls.')
+        parser.add_argument('--clear', action='store_true', dest='clear', default=False,
+                            help='Clear the slow log.')
+
+    def handle(self, *args, **options):
+        slow_log = SlowLog(cache=options['cache'])
+        if options['clear']:
+            slow_log.clear()
+            return
+        for entry in slow_log.entries(limit=options['limit']):
+            fields = dict(entry, time=datetime.fromtimestamp(entry['time']).isoformat())
+            self.stdout.write('{time} {duration:.3f}s {consumers}.{method} channel={channel} kwargs={kwargs} '
+                              'size={message_size} samples={samples}'.format(**fields))
+            if options['stacks'] and entry['stack']:
+                for frame in entry['stack']:
+                    self.stdout.write('    ' + frame)
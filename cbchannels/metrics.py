@@ -0,0 +1,221 @@
+"""
+Metrics of consumers: calls, errors and latency histograms labelled by consumers class, method and channel,
+queries and database time of consumers with `query_budget`
+"""
+from __future__ import unicode_literals
+
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from timeit import default_timer
+
+import six
+
+logger = logging.getLogger('cbchannels.queries')
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LABELS = ('consumers', 'method', 'channel')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    """Counts of observed values by buckets (upper bounds) with their sum"""
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """List of (upper bound, count of values less or equal to it), the last bound is +Inf"""
+        result, total = [], 0
+        for bound, count in zip(self.buckets + (float('inf'), ), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class QueryCounter(object):
+    """
+    Context manager that counts queries and their time on all database connections of the thread.
+    Uses execute wrappers if the backend has them, otherwise debug cursor logging to a separate log,
+    that is added to the connection log at exit if it was enabled
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = default_timer()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += default_timer() - start
+
+    def __enter__(self):
+        from django.db import connections
+        self._states = []
+        for alias in connections:
+            connection = connections[alias]
+            if hasattr(connection, 'execute_wrapper'):
+                wrapper = connection.execute_wrapper(self)
+                wrapper.__enter__()
+                self._states.append((connection, wrapper, None))
+                continue
+            logged = connection.queries_logged
+            if not logged:
+                connection.force_debug_cursor = True
+            # the connection log is limited, so its length does not tell the number of new queries
+            log, connection.queries_log = connection.queries_log, deque()
+            self._states.append((connection, logged, log))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        for connection, state, log in reversed(self._states):
+            if log is None:
+                state.__exit__(exc_type, exc_value, traceback)
+                continue
+            queries, connection.queries_log = connection.queries_log, log
+            self.count += len(queries)
+            self.time += sum(float(query['time']) for query in queries)
+            if state:
+                log.extend(queries)
+            else:
+                connection.force_debug_cursor = False
+
+
+class MetricsRegistry(object):
+    """
+    Default metrics sink: keeps metrics in process memory.
+    Any object with `observe(labels, seconds, error)` method can be used as a sink,
+    calls of consumers with `query_budget` are passed to its `observe_queries(labels, queries, db_seconds, over_budget)`
+    if it has one
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _get_stat(self, labels):
+        stat = self._stats.get(labels)
+        if stat is None:
+            stat = self._stats[labels] = {'calls': 0, 'errors': 0, 'duration': Histogram(self.buckets),
+                                          'queries': 0, 'db_seconds': 0.0, 'over_budget': 0}
+        return stat
+
+    def observe(self, labels, seconds, error=False):
+        with self._lock:
+            stat = self._get_stat(labels)
+            stat['calls'] += 1
+            if error:
+                stat['errors'] += 1
+            stat['duration'].observe(seconds)
+
+    def observe_queries(self, labels, queries, db_seconds, over_budget=False):
+        with self._lock:
+            stat = self._get_stat(labels)
+            stat['queries'] += queries
+            stat['db_seconds'] += db_seconds
+            if over_budget:
+                stat['over_budget'] += 1
+
+    def get(self, labels):
+        return self._stats.get(labels)
+
+    def collect(self):
+        """Sorted list of (labels, stat)"""
+        with self._lock:
+            return sorted(self._stats.items(), key=lambda item: item[0])
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+registry = MetricsRegistry()
+
+
+def get_sink(metrics):
+    """Return sink for the `metrics` setting of consumers: True means default registry"""
+    if metrics is True:
+        return registry
+    return metrics or None
+
+
+def _escape(value):
+    return six.text_type(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, **extra):
+    pairs = list(zip(LABELS, labels)) + sorted(extra.items())
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value)) for name, value in pairs) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+_QUERY_METRICS = (
+    ('cbchannels_consumer_queries_total', 'queries', 'counter', 'Number of queries of consumer calls.'),
+    ('cbchannels_consumer_db_seconds_total', 'db_seconds', 'counter', 'Database time of consumer calls.'),
+    ('cbchannels_consumer_query_budget_exceeded_total', 'over_budget', 'counter', 'Number of consumer calls over query budget.'),
+)
+
+
+def check_query_budget(labels, counter, budget):
+    """Log warning if consumer call made more queries than the budget, return True in that case"""
+    if counter.count <= budget:
+        return False
+    logger.warning('%s.%s (channel %s) made %d queries (%.3f s), budget is %d',
+                   labels[0], labels[1], labels[2], counter.count, counter.time, budget)
+    return True
+
+
+def export_prometheus(sink=None):
+    """Render metrics of the registry in Prometheus text format"""
+    stats = (sink or registry).collect()
+    lines = [
+        '# HELP cbchannels_consumer_calls_total Number of consumer calls.',
+        '# TYPE cbchannels_consumer_calls_total counter',
+    ]
+    lines.extend('cbchannels_consumer_calls_total{} {}'.format(_format_labels(labels), stat['calls']) for labels, stat in stats)
+    lines.extend([
+        '# HELP cbchannels_consumer_errors_total Number of consumer calls raised an exception.',
+        '# TYPE cbchannels_consumer_errors_total counter',
+    ])
+    lines.extend('cbchannels_consumer_errors_total{} {}'.format(_format_labels(labels), stat['errors']) for labels, stat in stats)
+    lines.extend([
+        '# HELP cbchannels_consumer_duration_seconds Duration of consumer calls.',
+        '# TYPE cbchannels_consumer_duration_seconds histogram',
+    ])
+    for labels, stat in stats:
+        histogram = stat['duration']
+        for bound, count in histogram.cumulative():
+            lines.append('cbchannels_consumer_duration_seconds_bucket{} {}'.format(
+                _format_labels(labels, le=_format_bound(bound)), count))
+        lines.append('cbchannels_consumer_duration_seconds_sum{} {!r}'.format(_format_labels(labels), histogram.sum))
+        lines.append('cbchannels_consumer_duration_seconds_count{} {}'.format(_format_labels(labels), histogram.count))
+    for name, key, kind, help_text in _QUERY_METRICS:
+        lines.extend([
+            '# HELP {} {}'.format(name, help_text),
+            '# TYPE {} {}'.format(name, kind),
+        ])
+        lines.extend('{}{} {!r}'.format(name, _format_labels(labels), stat[key]) for labels, stat in stats)
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """Django view with metrics of the default registry for Prometheus scraping"""
+    from django.http import HttpResponse
+    return HttpResponse(export_prometheus(), content_type=CONTENT_TYPE)
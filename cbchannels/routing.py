@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+import six
+
+try:
+    from django.channels.routing import Router
+except ImportError:
+    from channels.routing import Router
+
+_REGEX_CHARS = set('.^$*+?{}[]\\|()')
+
+
+def _parse_literal(pattern):
+    """
+    Return (literal, exact) if filter pattern matches only a fixed string
+    (exact - pattern anchored at the end), else None
+    """
+    pattern = Router.normalise_re_arg(pattern)
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    exact = pattern.endswith('$') and not pattern.endswith('\\$')
+    if exact:
+        pattern = pattern[:-1]
+    if _REGEX_CHARS.intersection(pattern):
+        return None
+    return pattern, exact
+
+
+class CompiledRoute(object):
+    """
+    Routable object that replaces several routes of one channel.
+    Routes with literal value for the most common filter key are indexed by that value,
+    so only routes that can match are checked, in the original order
+    """
+
+    def __init__(self, channel, routes):
+        self.channel = channel
+        self.routes = list(routes)
+        self.key = self._get_index_key(self.routes)
+        self.exact, self.prefix, self.others = {}, {}, []
+        for order, _route in enumerate(self.routes):
+            literal = _route.filters.get(self.key) if self.key else None
+            literal = _parse_literal(literal.pattern) if literal else None
+            if literal is None:
+                self.others.append((order, _route))
+                continue
+            value, exact = literal
+            (self.exact if exact else self.prefix).setdefault(value, []).append((order, _route))
+        self.prefix_lengths = sorted({len(value) for value in self.prefix})
+        self.other_routes = [_route for _, _route in self.others]
+
+    @staticmethod
+    def _get_index_key(routes):
+        counts = {}
+        for _route in routes:
+            for key, value in six.iteritems(_route.filters):
+                if _parse_literal(value.pattern):
+                    counts[key] = counts.get(key, 0) + 1
+        if not counts:
+            return None
+        return sorted(counts, key=lambda key: (-counts[key], key))[0]
+
+    def candidates(self, message):
+        if self.key not in message.content:
+            return self.other_routes
+        value = message.content[self.key]
+        if not isinstance(value, (six.string_types, six.binary_type)):
+            return self.routes
+        value = Router.normalise_re_arg(value)
+        candidates = list(self.exact.get(value, []))
+        for length in self.prefix_lengths:
+            candidates.extend(self.prefix.get(value[:length], []))
+        if not candidates:
+            return self.other_routes
+        candidates.extend(self.others)
+        return [_route for _, _route in sorted(candidates, key=lambda item: item[0])]
+
+    def match(self, message):
+        if message.channel.name != self.channel:
+            return None
+        for _route in self.candidates(message):
+            match = _route.match(message)
+            if match is not None:
+                return match
+        return None
+
+    def channel_names(self):
+        return {self.channel}
+
+    def __str__(self):
+        return '%s (compiled %s routes by %s)' % (self.channel, len(self.routes), self.key)
+
+
+def compile_routing(routes):
+    """
+    Merge routes listening the same single channel into CompiledRoute,
+    placed at the position of the first of them
+    """
+    by_channel = OrderedDict()
+    for _route in routes:
+        channels = _route.channel_names()
+        key = next(iter(channels)) if len(channels) == 1 and hasattr(_route, 'filters') else _route
+        by_channel.setdefault(key, []).append(_route)
+    return [group[0] if len(group) == 1 else CompiledRoute(key, group) for key, group in by_channel.items()]
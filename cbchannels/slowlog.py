@@ -0,0 +1,132 @@
+"""
+Log of slow consumer calls: route, kwargs, message size, duration and the stack sampled while the call was running
+"""
+from __future__ import unicode_literals
+
+import json
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from traceback import extract_stack
+
+import six
+from six.moves._thread import get_ident
+
+logger = logging.getLogger('cbchannels.slow')
+
+SLOW_LOG_KEY = 'cbchannels:slowlog'
+
+
+class StackSampler(object):
+    """
+    Daemon thread that samples stacks of consumer calls running longer than their threshold,
+    calls shorter than the threshold cost only registration in a dict (atomic operations, no locks)
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, threshold):
+        call = {'thread': get_ident(), 'start': time.time(), 'threshold': threshold, 'samples': None}
+        if self._thread is None:
+            self._start_thread()
+        self._calls[id(call)] = call
+        return call
+
+    def _start_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='cbchannels-stack-sampler')
+                self._thread.daemon = True
+                self._thread.start()
+
+    def stop(self, call):
+        self._calls.pop(id(call), None)
+
+    def sample(self):
+        now = time.time()
+        calls = [call for call in list(self._calls.values()) if now - call['start'] >= call['threshold']]
+        if not calls:
+            return
+        frames = sys._current_frames()
+        for call in calls:
+            frame = frames.get(call['thread'])
+            if frame is not None:
+                stack = tuple('{}:{} in {}'.format(filename, lineno, name) for filename, lineno, name, line in extract_stack(frame))
+                if call['samples'] is None:
+                    call['samples'] = Counter()
+                call['samples'][stack] += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+
+sampler = StackSampler()
+
+
+def _message_size(message):
+    try:
+        return len(json.dumps(message.content, default=six.text_type))
+    except (TypeError, ValueError):
+        return None
+
+
+class SlowLog(object):
+    """
+    Ring buffer of the last `maxlen` slow calls kept in a django cache,
+    use a cache shared by workers to see their calls from the management command
+    """
+
+    def __init__(self, cache='default', maxlen=100):
+        self.cache_alias = cache
+        self.maxlen = maxlen
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.cache_alias]
+
+    def record(self, labels, kwargs, message, seconds, call):
+        samples = call['samples'] or Counter()
+        stack = samples.most_common(1)[0][0] if samples else None
+        entry = {
+            'time': call['start'],
+            'consumers': labels[0],
+            'method': labels[1],
+            'channel': labels[2],
+            'kwargs': dict((key, six.text_type(value)) for key, value in six.iteritems(kwargs)),
+            'message_size': _message_size(message),
+            'duration': seconds,
+            'samples': sum(samples.values()),
+            'stack': list(stack) if stack else None,
+        }
+        logger.warning('%s.%s (channel %s) took %.3f s, kwargs %s, message size %s', labels[0], labels[1], labels[2],
+                       seconds, entry['kwargs'], entry['message_size'], extra={'slow_call': entry})
+        cache = self.cache
+        entries = cache.get(SLOW_LOG_KEY) or []
+        entries.append(entry)
+        cache.set(SLOW_LOG_KEY, entries[-self.maxlen:], None)
+        return entry
+
+    def entries(self, limit=None):
+        """Recorded calls, the last first"""
+        entries = list(reversed(self.cache.get(SLOW_LOG_KEY) or []))
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        self.cache.delete(SLOW_LOG_KEY)
+
+
+slow_log = SlowLog()
+
+
+def get_slow_log(value):
+    """Return slow log for the `slow_log` setting of consumers: default log if not set"""
+    return value or slow_log
@@ -0,0 +1,6 @@
+from django.db import models
+
+
+class Note(models.Model):
+    text = models.CharField(max_length=100)
+    modified = models.DateTimeField(auto_now=True)
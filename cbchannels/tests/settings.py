@@ -21,4 +21,6 @@ INSTALLED_APPS = [
     'django.contrib.auth',
 
     'channels',
+    'cbchannels',
+    'cbchannels.tests',
 ]
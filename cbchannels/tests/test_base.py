@@ -1,13 +1,23 @@
 from __future__ import unicode_literals
 
+import json
+import logging
+import time
 from functools import wraps
 
 from channels import include, DEFAULT_CHANNEL_LAYER
 from channels.message import Message
 from channels.tests import apply_routes, HttpClient, ChannelTestCase
 from channels.asgi import channel_layers
+from django.core.management import call_command
+from django.utils.six import StringIO
 
 from cbchannels import WebsocketConsumers as Consumers, consumer
+from cbchannels.cache import LRUCache
+from cbchannels.encoding import Encoder, get_dumps
+from cbchannels.exceptions import ConsumerError
+from cbchannels.metrics import MetricsRegistry, export_prometheus
+from cbchannels.slowlog import SlowLog
 
 
 class MainTest(ChannelTestCase):
@@ -188,3 +198,244 @@ class MainTest(ChannelTestCase):
             self.assertDictEqual(client.receive(), {'status': 'ok', 'mark': 'default'})
             client.consume('test2', fail_on_none=False)
             self.assertIsNone(client.receive())
+
+    def test_consumers_registry(self):
+
+        class Test(Consumers):
+            channel_name = 'test'
+
+            @consumer(tag='test')
+            def test(this, message):
+                return 'test'
+
+            @consumer('test2')
+            def test2(this, message):
+                return 'test2'
+
+        class Child(Test):
+
+            def test2(this, message):
+                return 'not a consumer'
+
+        self.assertEqual({c.__name__ for c in Test._get_consumers()},
+                         {'ws_connect', 'ws_disconnect', 'ws_receive', 'test', 'test2'})
+        self.assertEqual({c.__name__ for c in Child._get_consumers()},
+                         {'ws_connect', 'ws_disconnect', 'ws_receive', 'test'})
+
+        routes = Child.as_routes(channel_name='new')
+        self.assertEqual(routes.channel_names(), {'websocket.receive', 'websocket.connect',
+                                                  'websocket.disconnect', 'new'})
+
+    def test_init_kwargs(self):
+
+        class Test(Consumers):
+            channel_name = 'test'
+            _mark = None
+
+            @property
+            def mark(this):
+                return this._mark
+
+            @mark.setter
+            def mark(this, value):
+                this._mark = value.upper()
+
+            @consumer(tag='(?P<tag>[^/]+)')
+            def test(this, message, tag):
+                return this.mark, this.slug, this.kwargs
+
+        class InitTest(Test):
+
+            def __init__(this, *args, **kwargs):
+                super(InitTest, this).__init__(*args, **kwargs)
+                this.slug = this.slug * 2
+
+        channel_layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+        with self.assertRaises(ValueError):
+            Test.as_routes(reply_channel='test')
+
+        message = Message({'tag': 'tag', '_kwargs': {'pk': 1}}, 'test', channel_layer)
+        _consumer, kwargs = Test.as_routes(mark='new', slug='slug').match(message)
+        self.assertEqual(_consumer(message, **kwargs), ('NEW', 'slug', {'tag': 'tag', 'pk': 1}))
+
+        _consumer, kwargs = InitTest.as_routes(mark='new', slug='slug').match(message)
+        self.assertEqual(_consumer(message, **kwargs), ('NEW', 'slugslug', {'tag': 'tag', 'pk': 1}))
+
+    def test_dispatch_in_process(self):
+
+        class Test(Consumers):
+            path = '^/(?P<slug>[^/]+)'
+            channel_name = 'test'
+
+            @consumer(tag='test')
+            def test(this, message):
+                this.reply_channel.send({'slug': this.kwargs['slug'], 'mark': this.mark})
+
+        channel_layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+        client = HttpClient()
+
+        with apply_routes([Test.as_routes(dispatch_in_process=True, mark='local')]):
+            client.send_and_consume(u'websocket.receive', content={'path': '/name', 'tag': 'test'})
+            self.assertDictEqual(client.receive(), {'slug': 'name', 'mark': 'local'})
+
+            client.send_and_consume(u'websocket.receive', content={'path': '/name', 'tag': 'other'})
+            self.assertEqual(channel_layer.receive_many(['test']), (None, None))
+
+        with apply_routes([Test.as_routes(dispatch_in_process=True, dispatch_fallback=True, mark='fallback')]):
+            client.send_and_consume(u'websocket.receive', content={'path': '/name', 'tag': 'test'})
+            self.assertDictEqual(client.receive(), {'slug': 'name', 'mark': 'fallback'})
+            self.assertEqual(channel_layer.receive_many(['test']), (None, None))
+
+            client.send_and_consume(u'websocket.receive', content={'path': '/name', 'tag': 'other'})
+            self.assertEqual(channel_layer.receive_many(['test'])[1]['tag'], 'other')
+
+    def test_compile_routes(self):
+
+        class Test(Consumers):
+            channel_name = 'test'
+
+            @consumer(action='^create$')
+            def create(this, message):
+                return 'create'
+
+            @consumer(action='update', tag=r'(?P<tag>\w+)')
+            def update(this, message, tag):
+                return 'update ' + tag
+
+            @consumer(action='update')
+            def update_all(this, message):
+                return 'update all'
+
+            @consumer(action=r'(?P<action>\w+)_many')
+            def many(this, message, action):
+                return 'many ' + action
+
+            @consumer(tag='test')
+            def tag(this, message):
+                return 'tag'
+
+        channel_layer = channel_layers[DEFAULT_CHANNEL_LAYER]
+        routes = Test.as_routes()
+        compiled = Test.as_routes(compile_routes=True)
+        self.assertEqual(routes.channel_names(), compiled.channel_names())
+        self.assertEqual(len(compiled.routing), 4)
+
+        for content in [{'action': 'create'}, {'action': 'created'}, {'action': 'update'},
+                        {'action': 'update', 'tag': 'new'}, {'action': 'updated'}, {'action': 'create_many'},
+                        {'tag': 'test'}, {'action': 'delete', 'tag': 'test'}, {}]:
+            message = Message(content, 'test', channel_layer)
+            match, compiled_match = routes.match(message), compiled.match(message)
+            if match is None:
+                self.assertIsNone(compiled_match, content)
+                continue
+            self.assertEqual(match[1], compiled_match[1], content)
+            self.assertEqual(match[0](message, **match[1]), compiled_match[0](message, **compiled_match[1]), content)
+
+    def test_encoder(self):
+        encoder = Encoder(backend='json')
+        data = json.dumps({'name': 'null', 'value': None})
+        self.assertEqual(json.loads(encoder.event('updated', data)),
+                         {'action': 'updated', 'data': {'name': 'null', 'value': None}})
+        self.assertEqual(json.loads(encoder.batch([('created', data), ('deleted', '{}')])),
+                         {'action': 'batch', 'data': [{'action': 'created', 'data': {'name': 'null', 'value': None}},
+                                                      {'action': 'deleted', 'data': {}}]})
+        self.assertEqual(json.loads(encoder.dumps({'text': 'test'})), {'text': 'test'})
+        with self.assertRaises(ValueError):
+            Encoder(backend='unknown')
+        self.assertIs(Encoder().dumps, get_dumps('json'))
+        with self.settings(CBCHANNELS_JSON_BACKEND='auto'):
+            self.assertIs(Encoder().dumps, get_dumps('auto'))
+
+    def test_lru_cache(self):
+        cache = LRUCache(maxsize=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        # 'b' is the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+        self.assertEqual(cache.incr('a'), 2)
+        with self.assertRaises(ValueError):
+            cache.incr('b')
+        cache.set('a', 1, timeout=0)
+        self.assertEqual(cache.get('a', 'default'), 'default')
+        cache.delete('c')
+        self.assertEqual(len(cache), 0)
+
+    def test_metrics(self):
+        sink = MetricsRegistry(buckets=(0.5, 1))
+
+        class Test(Consumers):
+            channel_name = 'test'
+
+            @consumer(tag='ok')
+            def ok(this, message):
+                pass
+
+            @consumer(tag='fail')
+            def fail(this, message):
+                raise ConsumerError('fail')
+
+        with apply_routes([Test.as_routes(metrics=sink), Test.as_routes(channel_name='plain')]):
+            client = HttpClient()
+            client.send_and_consume(u'test', content={'tag': 'ok'})
+            client.send_and_consume(u'test', content={'tag': 'ok'})
+            client.send_and_consume(u'test', content={'tag': 'fail'})
+            client.send_and_consume(u'plain', content={'tag': 'ok'})
+
+        stat = sink.get(('Test', 'ok', 'test'))
+        self.assertEqual((stat['calls'], stat['errors'], stat['duration'].count), (2, 0, 2))
+        self.assertEqual(sink.get(('Test', 'fail', 'test'))['errors'], 1)
+        self.assertEqual(len(sink.collect()), 2)
+
+        text = export_prometheus(sink)
+        self.assertIn('cbchannels_consumer_calls_total{consumers="Test",method="ok",channel="test"} 2', text)
+        self.assertIn('cbchannels_consumer_errors_total{consumers="Test",method="fail",channel="test"} 1', text)
+        self.assertIn('cbchannels_consumer_duration_seconds_bucket{consumers="Test",method="ok",channel="test",le="0.5"} 2', text)
+        self.assertIn('cbchannels_consumer_duration_seconds_bucket{consumers="Test",method="ok",channel="test",le="+Inf"} 2', text)
+        self.assertIn('cbchannels_consumer_duration_seconds_count{consumers="Test",method="ok",channel="test"} 2', text)
+
+    def test_slow_log(self):
+        slow_log = SlowLog(cache='default', maxlen=2)
+        slow_log.clear()
+
+        def sleeping(seconds):
+            time.sleep(seconds)
+
+        class Test(Consumers):
+            channel_name = 'test'
+
+            @consumer(tag=r'(?P<tag>\w+)')
+            def sleep(this, message, **kwargs):
+                sleeping(float(message.content['seconds']))
+
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger('cbchannels.slow').addHandler(handler)
+        try:
+            with apply_routes([Test.as_routes(slow_threshold=0.05, slow_log=slow_log)]):
+                client = HttpClient()
+                client.send_and_consume(u'test', content={'tag': 'fast', 'seconds': 0})
+                self.assertEqual(slow_log.entries(), [])
+                client.send_and_consume(u'test', content={'tag': 'slow', 'seconds': 0.2})
+        finally:
+            logging.getLogger('cbchannels.slow').removeHandler(handler)
+        self.assertEqual(len(records), 1)
+        self.assertIn('Test.sleep (channel test) took 0.2', records[0].getMessage())
+
+        entry = slow_log.entries()[0]
+        self.assertEqual((entry['consumers'], entry['method'], entry['channel'], entry['kwargs']),
+                         ('Test', 'sleep', 'test', {'tag': 'slow'}))
+        self.assertGreaterEqual(entry['duration'], 0.2)
+        self.assertGreater(entry['message_size'], 0)
+        self.assertGreater(entry['samples'], 0)
+        self.assertIn('in sleeping', entry['stack'][-1])
+
+        out = StringIO()
+        call_command('cbchannels_slowlog', stacks=True, stdout=out)
+        self.assertIn('Test.sleep channel=test', out.getvalue())
+        self.assertIn('in sleeping', out.getvalue())
+        call_command('cbchannels_slowlog', clear=True)
+        self.assertEqual(slow_log.entries(), [])
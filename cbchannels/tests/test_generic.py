@@ -1,13 +1,20 @@
 from __future__ import unicode_literals
 
+import logging
+
 from channels import asgi, DEFAULT_CHANNEL_LAYER
 from channels.tests import ChannelTestCase, HttpClient, apply_routes
 
 from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from cbchannels import WebsocketConsumers as Consumers, consumer
-from cbchannels.generic.base import GroupConsumers
+from cbchannels.generic.base import (GroupConsumers, PermissionMixin, SessionMixin, invalidate_permissions, permission,
+                                     _memberships)
 from cbchannels.generic.auth import UserMixin
+from cbchannels.generic.sessions import connections
 
 
 class TestGeneric(ChannelTestCase):
@@ -44,6 +51,69 @@ class TestGeneric(ChannelTestCase):
         self.assertTrue('test_123' in channel_layer._groups.keys())
         self.assertTrue('test.reply_channel' in channel_layer._groups['test_123'].keys())
 
+    def test_group_consumers_leave_all(self):
+        channel_layer = asgi.channel_layers[DEFAULT_CHANNEL_LAYER]
+
+        class _GroupConsumers(GroupConsumers):
+            channel_name = 'test'
+            group_name = 'main'
+            path = '/test'
+
+            def on_receive(self, message, **kwargs):
+                self.join(message.content['text'])
+
+        class _SessionGroupConsumers(SessionMixin, _GroupConsumers):
+            path = '/session'
+
+        class _CacheGroupConsumers(_GroupConsumers):
+            path = '/cache'
+            membership_cache = 'default'
+
+        routes = [_GroupConsumers.as_routes(), _SessionGroupConsumers.as_routes(), _CacheGroupConsumers.as_routes()]
+        for path in ('/test', '/session', '/cache'):
+            reply_channel = 'test.reply_channel.' + path.strip('/')
+            with apply_routes(routes):
+                self.client.send_and_consume(u'websocket.connect', {'path': path, 'reply_channel': reply_channel})
+                for room in ('room1', 'room2'):
+                    self.client.send_and_consume(u'websocket.receive',
+                                                 {'text': room, 'path': path, 'reply_channel': reply_channel})
+                for group in ('main', 'room1', 'room2'):
+                    self.assertIn(reply_channel, channel_layer._groups[group], path)
+                if path == '/cache':
+                    # memberships are shared by workers in the cache
+                    self.assertEqual(caches['default'].get('cbchannels:groups:' + reply_channel), ['main', 'room1', 'room2'])
+
+                self.client.send_and_consume(u'websocket.disconnect', {'path': path, 'reply_channel': reply_channel})
+                self.assertIsNone(caches['default'].get('cbchannels:groups:' + reply_channel))
+                for group in ('main', 'room1', 'room2'):
+                    self.assertNotIn(reply_channel, channel_layer._groups.get(group, {}), path)
+
+        # memberships are lost (handled by another process or evicted): the own group is left and it is logged
+        lost = [('/cache', logging.WARNING, lambda name: caches['default'].delete('cbchannels:groups:' + name)),
+                ('/test', logging.DEBUG, lambda name: _memberships.delete(name))]
+        logger = logging.getLogger('cbchannels.groups')
+        for path, level, forget in lost:
+            records = []
+            handler = logging.Handler()
+            handler.emit = records.append
+            logger.addHandler(handler)
+            logger.setLevel(logging.DEBUG)
+            try:
+                with apply_routes(routes):
+                    reply_channel = 'test.reply_channel.lost.' + path.strip('/')
+                    self.client.send_and_consume(u'websocket.connect', {'path': path, 'reply_channel': reply_channel})
+                    self.client.send_and_consume(u'websocket.receive',
+                                                 {'text': 'room1', 'path': path, 'reply_channel': reply_channel})
+                    forget(reply_channel)
+                    self.client.send_and_consume(u'websocket.disconnect', {'path': path, 'reply_channel': reply_channel})
+            finally:
+                logger.removeHandler(handler)
+                logger.setLevel(logging.NOTSET)
+            self.assertEqual([record.levelno for record in records], [level], path)
+            self.assertIn(reply_channel, records[0].getMessage())
+            self.assertNotIn(reply_channel, channel_layer._groups.get('main', {}))
+            self.assertIn(reply_channel, channel_layer._groups['room1'])
+
     def test_user_consumer(self):
         User.objects.create_user('test', 'test@test.test', '123')
 
@@ -69,3 +139,105 @@ class TestGeneric(ChannelTestCase):
             user = self.client.consume(u'test')
             self.assertTrue(isinstance(user, User))
             self.assertDictEqual(self.client.receive(), {'test': 123})
+
+    def test_user_consumer_session_cache(self):
+        User.objects.create_user('test', 'test@test.test', '123')
+
+        class _Consumers(UserMixin, SessionMixin, Consumers):
+            path = '/test'
+            channel_name = 'test'
+            session_cache_timeout = 60
+
+            def on_receive(self, message, **kwargs):
+                self.session['count'] = self.session.get('count', 0) + 1
+                self.reply_channel.send({'user': self.user.username, 'count': self.session['count']})
+
+        def _receive():
+            with CaptureQueriesContext(connection) as queries:
+                self.client.send_and_consume(u'websocket.receive', {'text': 'test', 'path': '/test'})
+            return [query['sql'] for query in queries.captured_queries
+                    if 'django_session' in query['sql'] and 'SELECT' in query['sql']]
+
+        user = User.objects.get(username='test')
+        self.client.login(username='test', password='123')
+        with apply_routes([_Consumers.as_routes()]):
+            self.client.send_and_consume(u'websocket.connect', {'path': '/test'})
+            self.assertEqual(len(_receive()), 0)
+            self.assertDictEqual(self.client.receive(), {'user': 'test', 'count': 1})
+            self.assertEqual(len(_receive()), 0)
+            self.assertDictEqual(self.client.receive(), {'user': 'test', 'count': 2})
+
+            # user is checked on every message
+            user.is_active = False
+            user.save()
+            self.assertEqual(len(_receive()), 0)
+            self.assertDictEqual(self.client.receive(), {'user': '', 'count': 3})
+
+            self.client.send_and_consume(u'websocket.disconnect', {'path': '/test'})
+            self.assertEqual(len(connections), 0)
+            self.assertTrue(_receive())
+            self.assertDictEqual(self.client.receive(), {'user': '', 'count': 4})
+
+    def test_permission_cache(self):
+        calls = []
+
+        @permission(cost=10, cache=True)
+        def expensive(consumers):
+            calls.append('expensive')
+            return consumers.kwargs['room'] != 'closed'
+
+        def cheap(consumers):
+            calls.append('cheap')
+            return consumers.message.content['text'] != 'spam'
+
+        @permission()
+        def uncached(consumers):
+            calls.append('uncached')
+            return True
+
+        class _EchoConsumers(Consumers):
+            def on_receive(self, message, **kwargs):
+                self.reply_channel.send({'ok': True})
+
+        class _Consumers(PermissionMixin, _EchoConsumers):
+            path = r'/test/(?P<room>\w+)'
+            channel_name = 'test'
+            permissions = [expensive, cheap, uncached]
+            permission_cache_timeout = 60
+
+        def _receive(room, text='test'):
+            self.client.send_and_consume(u'websocket.receive', {'text': text, 'path': '/test/' + room})
+            return self.client.receive()
+
+        with apply_routes([_Consumers.as_routes()]):
+            self.assertDictEqual(_receive('open'), {'ok': True})
+            self.assertEqual(calls, ['cheap', 'uncached', 'expensive'])
+            self.assertDictEqual(_receive('open'), {'ok': True})
+            self.assertEqual(calls, ['cheap', 'uncached', 'expensive', 'cheap', 'uncached'])
+            # checks of the message content are not cached
+            self.assertIsNone(_receive('open', 'spam'))
+
+            del calls[:]
+            self.assertIsNone(_receive('closed'))
+            self.assertEqual(calls, ['cheap', 'uncached', 'expensive'])
+            self.assertIsNone(_receive('closed'))
+            self.assertEqual(calls, ['cheap', 'uncached', 'expensive', 'cheap', 'uncached'])
+
+            del calls[:]
+            self.assertIsNone(_receive('other', 'spam'))
+            self.assertEqual(calls, ['cheap'])
+
+            del calls[:]
+            self.client.send_and_consume(u'websocket.disconnect', {'path': '/test/open'})
+            self.assertDictEqual(_receive('open'), {'ok': True})
+            self.assertEqual(calls, ['cheap', 'uncached', 'expensive'])
+
+            # invalidation made by another process is seen through the shared cache
+            del calls[:]
+            _receive('open')
+            self.assertEqual(calls, ['cheap', 'uncached'])
+            for reply_channel in (self.client.reply_channel, None):
+                del calls[:]
+                invalidate_permissions(reply_channel)
+                self.assertDictEqual(_receive('open'), {'ok': True})
+                self.assertEqual(calls, ['cheap', 'uncached', 'expensive'])
@@ -1,17 +1,60 @@
 from __future__ import unicode_literals
 
+import base64
+import hashlib
 import json
+import logging
+import time
+from collections import deque
+from unittest import skipIf
+
 from channels.tests import ChannelTestCase, HttpClient, apply_routes
 
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group, User
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.test.utils import CaptureQueriesContext
 
+from cbchannels.cache import LRUCache, instance_cache
 from cbchannels.generic.models import (ObjectSubscribeConsumers, ModelSubscribeConsumers, ReadOnlyConsumers,
-                                       CreateConsumers, DeleteConsumers, UpdateConsumers, ListConsumers, CRUDConsumers)
-from cbchannels.generic.serializers import SimpleSerializer
+                                       CreateConsumers, DeleteConsumers, UpdateConsumers, ListConsumers, CRUDConsumers,
+                                       _deferred_handlers)
+from cbchannels.generic import pagination
+from cbchannels.generic.broadcast import Throttle, get_window_buffer
+from cbchannels.generic.pagination import CursorPaginator
+from cbchannels.generic.predicates import QuerysetPredicate
+from cbchannels.generic.serializers import CompiledSerializer, SimpleSerializer
+from cbchannels.metrics import MetricsRegistry
+from cbchannels.tests.models import Note
+
+
+def run_commit_callbacks(using='default'):
+    """Test case transaction is never committed, run its commit callbacks by hand (Django 1.9+)"""
+    connection = connections[using]
+    if not hasattr(connection, 'run_on_commit'):
+        return
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    for entry in callbacks:
+        entry[1]()
 
 
 class ModelsTestCase(ChannelTestCase):
 
+    def setUp(self):
+        super(ModelsTestCase, self).setUp()
+        self._receivers = [(signal, list(signal.receivers)) for signal in (pre_save, post_save, pre_delete, post_delete)]
+
+    def tearDown(self):
+        # consumers connect model signals globally: disconnect receivers of the test and forget the watched models
+        for signal, receivers in self._receivers:
+            with signal.lock:
+                signal.receivers = receivers
+                signal.sender_receivers_cache.clear()
+        instance_cache._watched.clear()
+        pagination._count_caches.clear()
+        super(ModelsTestCase, self).tearDown()
+
     def test_serializer(self):
         obj = User.objects.create_user(username='test', email='t@t.tt')
         self.assertDictEqual(json.loads(SimpleSerializer(obj, fields=['username', 'email']).data),
@@ -21,6 +64,29 @@ class ModelsTestCase(ChannelTestCase):
         self.assertEqual(json.loads(SimpleSerializer(obj).data)['email'], 't@t.tt')
         self.assertEqual(json.loads(SimpleSerializer(obj).data)['is_active'], True)
 
+    def test_compiled_serializer(self):
+        for i in range(5):
+            User.objects.create_user(username='test' + str(i), email='t@t.tt')
+        obj = User.objects.first()
+        self.assertEqual(json.loads(CompiledSerializer(obj).data), json.loads(SimpleSerializer(obj).data))
+        self.assertEqual(json.loads(CompiledSerializer(obj, fields=['username', 'email']).data),
+                         {'email': 't@t.tt', 'username': 'test0'})
+        self.assertEqual(json.loads(CompiledSerializer(obj, exclude=['password', 'groups']).data),
+                         json.loads(SimpleSerializer(obj, exclude=['password', 'groups']).data))
+        self.assertIsNone(CompiledSerializer(obj, fields=['_']).data)
+
+        queryset = User.objects.order_by('pk')[1:4]
+        with self.assertNumQueries(3):
+            # one query for users and one per many to many field
+            data = json.loads(CompiledSerializer(queryset, many=True).data)
+        self.assertEqual(data, json.loads(SimpleSerializer(queryset, many=True).data))
+
+        group = Group.objects.create(name='test')
+        group.user_set.add(*User.objects.order_by('pk')[:2])
+        data = json.loads(CompiledSerializer(User.objects.order_by('pk'), many=True, fields=['username', 'groups']).data)
+        self.assertEqual([item['groups'] for item in data], [[group.pk], [group.pk], [], [], []])
+        self.assertEqual(json.loads(CompiledSerializer(obj, fields=['groups']).data), {'groups': [group.pk]})
+
     def test_object_sub(self):
 
         # create object for subscribe
@@ -116,6 +182,185 @@ class ModelsTestCase(ChannelTestCase):
             # check that nothing happened
             self.assertIsNone(client.receive())
 
+    def test_object_sub_delta(self):
+        sub_object = User.objects.create(username='test', email='t@t.tt')
+        routes = ObjectSubscribeConsumers.as_routes(path=r'/(?P<pk>\d+)/?', model=User, delta=True, delta_resync=2,
+                                                    serializer_kwargs={'fields': ['username', 'email', 'is_active']})
+        client = HttpClient()
+        with apply_routes([routes]):
+            client.send_and_consume(u'websocket.connect', content={'path': '/{}'.format(sub_object.pk)})
+            message = json.loads(client.receive()['text'])
+            version = message['data'].pop('_version')
+            self.assertEqual(message, {'action': 'updated', 'data': {'username': 'test', 'email': 't@t.tt', 'is_active': True}})
+
+            for username in ('first', 'second'):
+                sub_object.username = username
+                sub_object.save()
+                message = json.loads(client.receive()['text'])
+                self.assertEqual(message['data'].pop('_base'), version)
+                version = message['data'].pop('_version')
+                self.assertEqual(message, {'action': 'patched', 'data': {'username': username}})
+
+            # resync
+            sub_object.username = 'third'
+            sub_object.save()
+            message = json.loads(client.receive()['text'])
+            self.assertNotEqual(message['data'].pop('_version'), version)
+            self.assertEqual(message, {'action': 'updated', 'data': {'username': 'third', 'email': 't@t.tt', 'is_active': True}})
+
+            # the state could be changed by another process, so it is sent in full
+            sub_object.save()
+            message = json.loads(client.receive()['text'])
+            self.assertNotIn('_base', message['data'])
+            self.assertEqual(message['action'], 'updated')
+
+            # a new subscriber gets the last sent state
+            other = HttpClient()
+            other.send_and_consume(u'websocket.connect', content={'path': '/{}'.format(sub_object.pk)})
+            self.assertEqual(json.loads(other.receive()['text']), message)
+            self.assertIsNone(client.receive())
+
+            sub_object.delete()
+            self.assertEqual(json.loads(client.receive()['text'])['action'], 'deleted')
+
+    def test_object_sub_throttle(self):
+        sub_object = User.objects.create(username='test', email='t@t.tt')
+        routes = ObjectSubscribeConsumers.as_routes(path=r'/(?P<pk>\d+)/?', model=User, throttle=(2, 0.3),
+                                                    throttle_cache='default', serializer_kwargs={'fields': ['username']})
+        client = HttpClient()
+        with apply_routes([routes]):
+            client.send_and_consume(u'websocket.connect', content={'path': '/{}'.format(sub_object.pk)})
+            # start at the beginning of the interval
+            time.sleep(0.3 - time.time() % 0.3 + 0.01)
+            for i in range(5):
+                sub_object.username = 'test' + str(i)
+                sub_object.save()
+            self.assertEqual([json.loads(client.receive()['text'])['data']['username'] for _ in range(2)], ['test0', 'test1'])
+            self.assertIsNone(client.receive())
+
+            time.sleep(0.4)
+            self.assertEqual(json.loads(client.receive()['text']), {'action': 'updated', 'data': {'username': 'test4'}})
+            self.assertIsNone(client.receive())
+
+            sub_object.delete()
+            self.assertEqual(json.loads(client.receive()['text'])['action'], 'deleted')
+
+    def test_throttle_merges_pending(self):
+        throttle = Throttle(1, 0.5, LRUCache())
+        self.assertEqual(throttle.timeout, 1)
+        pending_key = 'cbchannels:throttle:pending:' + hashlib.md5(b'group:1').hexdigest()
+        # throttled update of the previous interval is not flushed yet
+        throttle.cache.set(pending_key, ('patched', '{"a": 1, "b": 2}'))
+        action, data = throttle.allow('group', 1, 'patched', '{"b": 3}')
+        self.assertEqual((action, json.loads(data)), ('patched', {'a': 1, 'b': 3}))
+        self.assertIsNone(throttle.cache.get(pending_key))
+
+    def test_sub_deferred(self):
+        sub_object = User.objects.create(username='test', email='t@t.tt')
+        client = HttpClient()
+        object_routes = ObjectSubscribeConsumers.as_routes(path=r'/(?P<pk>\d+)/?', model=User, deferred=True,
+                                                           channel_name='deferred_object',
+                                                           serializer_kwargs={'fields': ['username']})
+        with apply_routes([object_routes,
+                           ModelSubscribeConsumers.as_routes(path='/all', queryset=User.objects.filter(email='t@t.tt', is_staff=False),
+                                                             deferred=True, channel_name='deferred_model',
+                                                             serializer_kwargs={'fields': ['username']})]):
+            client.send_and_consume(u'websocket.connect', content={'path': '/{}'.format(sub_object.pk)})
+            client.send_and_consume(u'websocket.connect', content={'path': '/all'})
+
+            with CaptureQueriesContext(connection) as queries:
+                sub_object.username = 'new_name'
+                sub_object.save()
+            # queryset is not checked and nothing is sent before commit
+            self.assertFalse([q for q in queries.captured_queries if 'is_staff' in q['sql'] and 'UPDATE' not in q['sql']])
+            self.assertIsNone(client.receive())
+
+            run_commit_callbacks()
+            self.assertIsNone(client.receive())
+
+            client.consume('deferred_object')
+            self.assertEqual(json.loads(client.receive()['text']), {'action': 'updated', 'data': {'username': 'new_name'}})
+            client.consume('deferred_model')
+            self.assertEqual(json.loads(client.receive()['text']), {'action': 'updated', 'data': {'username': 'new_name'}})
+
+            sub_object.email = 'other@t.tt'
+            sub_object.save(update_fields=['email'])
+            run_commit_callbacks()
+            client.consume('deferred_model')
+            # object is not in the queryset anymore
+            self.assertIsNone(client.receive())
+
+            # routes of the subscription were built by another process
+            uid = [route for route in object_routes.routing if '_uid' in route.filters][0].filters['_uid'].pattern.strip('^$')
+            deferred_handler = _deferred_handlers.pop(uid)
+            records = []
+            handler = logging.Handler()
+            handler.emit = records.append
+            logging.getLogger('cbchannels.deferred').addHandler(handler)
+            try:
+                sub_object.save()
+                run_commit_callbacks()
+                client.consume('deferred_object')
+                self.assertIsNone(client.receive())
+            finally:
+                logging.getLogger('cbchannels.deferred').removeHandler(handler)
+                _deferred_handlers[uid] = deferred_handler
+            self.assertEqual(len(records), 1)
+            self.assertEqual(records[0].levelno, logging.WARNING)
+            self.assertIn('No handler of deferred saves of auth.user for ' + uid, records[0].getMessage())
+
+        routes = ObjectSubscribeConsumers.as_routes(path=r'/(?P<pk>\d+)/?', model=User, channel_name='not_deferred')
+        self.assertFalse([route for route in routes.routing if '_uid' in route.filters])
+
+    @skipIf(not hasattr(transaction, 'on_commit'), 'transaction.on_commit requires Django 1.9+')
+    def test_object_sub_coalesce_transaction(self):
+        sub_object = User.objects.create_user(username='test', email='t@t.tt')
+        routes = ObjectSubscribeConsumers.as_routes(path=r'/(?P<pk>\d+)/?', model=User, coalesce='transaction',
+                                                    serializer_kwargs={'fields': ['username', 'email']})
+        client = HttpClient()
+        with apply_routes([routes]):
+            client.send_and_consume(u'websocket.connect', content={'path': '/{}'.format(sub_object.pk)})
+
+            with transaction.atomic():
+                for i in range(5):
+                    sub_object.username = 'test' + str(i)
+                    sub_object.save(update_fields=['username'])
+                sub_object.email = 'new@email.com'
+                sub_object.save(update_fields=['email'])
+                self.assertIsNone(client.receive())
+
+            run_commit_callbacks()
+
+            res = json.loads(client.receive()['text'])
+            self.assertEqual(res['action'], 'updated')
+            self.assertEqual(res['data'], {'username': 'test4', 'email': 'new@email.com'})
+            self.assertIsNone(client.receive())
+
+    def test_model_sub_coalesce_window(self):
+        routes = ModelSubscribeConsumers.as_routes(model=User, coalesce=60,
+                                                   serializer_kwargs={'fields': ['username']})
+        client = HttpClient()
+        with apply_routes([routes]):
+            client.send_and_consume(u'websocket.connect')
+
+            first = User.objects.create_user(username='test', email='t@t.tt')
+            first.username = 'first'
+            first.save()
+            User.objects.create_user(username='second', email='t@t.tt')
+            User.objects.create_user(username='deleted', email='t@t.tt').delete()
+            self.assertIsNone(client.receive())
+
+            # end of the window
+            buffer = get_window_buffer(60)
+            buffer.timer.cancel()
+            buffer.flush()
+
+            res = json.loads(client.receive()['text'])
+            self.assertEqual(res['action'], 'batch')
+            self.assertEqual(res['data'], [{'action': 'created', 'data': {'username': 'first'}},
+                                           {'action': 'created', 'data': {'username': 'second'}}])
+            self.assertIsNone(client.receive())
+
     def test_object_sub_with_subs_first(self):
         # define consumers
         routes = ObjectSubscribeConsumers.as_routes(path='/(?P<pk>\d+)/?', model=User)
@@ -196,6 +441,119 @@ class ModelsTestCase(ChannelTestCase):
             self.assertNotIn('is_active', res['data'])
             self.assertNotIn('email', res['data'])
 
+    def test_queryset_predicate(self):
+        users = [User.objects.create(username='test' + str(i), email='t{}@t.tt'.format(i) if i % 2 else '',
+                                     is_active=bool(i % 3)) for i in range(6)]
+        users[0].last_login = users[1].date_joined
+        users[0].save()
+
+        querysets = [User.objects.all(), User.objects.filter(is_active=True), User.objects.exclude(email=''),
+                     User.objects.filter(Q(pk__in=[users[0].pk, users[4].pk]) | Q(username__gte='test3')),
+                     User.objects.filter(last_login__isnull=True), User.objects.exclude(last_login__lt=users[1].date_joined),
+                     User.objects.filter(is_active=True).exclude(username='test1')]
+        for queryset in querysets:
+            predicate = QuerysetPredicate.compile(queryset)
+            self.assertIsNotNone(predicate, queryset.query)
+            expected = set(queryset.values_list('pk', flat=True))
+            with self.assertNumQueries(0):
+                self.assertEqual({user.pk for user in users if predicate.matches(user)}, expected, queryset.query)
+
+        self.assertIsNone(QuerysetPredicate.compile(User.objects.filter(groups__name='test')))
+        self.assertIsNone(QuerysetPredicate.compile(User.objects.filter(username__icontains='test')))
+        # values assigned in their string form are normalized
+        users[1].last_login = users[1].date_joined.isoformat()
+        predicate = QuerysetPredicate.compile(User.objects.filter(last_login=users[1].date_joined))
+        self.assertTrue(predicate.matches(users[1]))
+        users[1].last_login = 'not a date'
+        self.assertIsNone(predicate.matches(users[1]))
+
+        predicate = QuerysetPredicate.compile(User.objects.filter(is_active=True))
+        self.assertIsNone(predicate.matches(users[1], update_fields=['username']))
+        self.assertIsNone(predicate.matches(User.objects.only('username').get(pk=users[1].pk)))
+
+    def test_model_sub_in_memory_filter(self):
+        routes = ModelSubscribeConsumers.as_routes(model=User, queryset=User.objects.filter(is_active=True),
+                                                   in_memory_filter=True, serializer_kwargs={'fields': ['username']})
+
+        client = HttpClient()
+        with apply_routes([routes]):
+            client.send_and_consume(u'websocket.connect')
+
+            # only inserts
+            with self.assertNumQueries(2):
+                User.objects.create(username='active', is_active=True)
+                inactive = User.objects.create(username='inactive', is_active=False)
+            self.assertEqual(json.loads(client.receive()['text'])['data']['username'], 'active')
+            self.assertIsNone(client.receive())
+
+            # is_active is not saved: update and the database check
+            with self.assertNumQueries(2):
+                inactive.save(update_fields=['username'])
+            self.assertIsNone(client.receive())
+
+    def test_model_sub_delete_filter(self):
+        users = [User.objects.create_user(username='test' + str(i), email='t@t.tt', last_name='odd' if i % 2 else '')
+                 for i in range(6)]
+        in_memory = ModelSubscribeConsumers.as_routes(model=User, queryset=User.objects.filter(last_name='odd'),
+                                                      in_memory_filter=True, serializer_kwargs={'fields': ['username']})
+        by_query = ModelSubscribeConsumers.as_routes(model=User, queryset=User.objects.filter(username='test0'),
+                                                     serializer_kwargs={'fields': ['username']})
+        client, client2 = HttpClient(), HttpClient()
+        with apply_routes([in_memory]):
+            client.send_and_consume(u'websocket.connect')
+        with apply_routes([by_query]):
+            client2.send_and_consume(u'websocket.connect')
+
+        users[0].delete()
+        self.assertIsNone(client.receive())
+        self.assertEqual(json.loads(client2.receive()['text']),
+                         {'action': 'deleted', 'data': {'username': 'test0'}})
+
+        # bulk delete
+        User.objects.filter(pk__in=[user.pk for user in users[1:5]]).delete()
+        received = [json.loads(client.receive()['text'])['data']['username'] for _ in range(2)]
+        self.assertEqual(sorted(received), ['test1', 'test3'])
+        self.assertIsNone(client.receive())
+        self.assertIsNone(client2.receive())
+
+    def test_sub_serialize_once(self):
+        calls = []
+
+        class Serializer(SimpleSerializer):
+            @property
+            def data(self):
+                calls.append(self.instance.pk)
+                return super(Serializer, self).data
+
+        class _ObjectSubscribeConsumers(ObjectSubscribeConsumers):
+            serializer_class = Serializer
+
+        class _ModelSubscribeConsumers(ModelSubscribeConsumers):
+            serializer_class = Serializer
+
+        user = User.objects.create_user(username='test', email='t@t.tt')
+        serializer_kwargs = {'fields': ['username', 'email']}
+        routes = [_ObjectSubscribeConsumers.as_routes(path=r'/(?P<pk>\d+)/?', model=User, serializer_kwargs=serializer_kwargs),
+                  _ObjectSubscribeConsumers.as_routes(path=r'/o/(?P<pk>\d+)/?', model=User,
+                                                      serializer_kwargs={'fields': ['email', 'username']}),
+                  _ModelSubscribeConsumers.as_routes(path='/', model=User, serializer_kwargs=serializer_kwargs)]
+        clients = [HttpClient() for _ in routes]
+        for client, path, route in zip(clients, ['/{}'.format(user.pk), '/o/{}'.format(user.pk), '/'], routes):
+            with apply_routes([route]):
+                client.send_and_consume(u'websocket.connect', {'path': path})
+
+        user.username = 'new'
+        user.save()
+        self.assertEqual(calls, [user.pk])
+        for client in clients:
+            self.assertEqual(json.loads(client.receive()['text'])['data'], {'username': 'new', 'email': 't@t.tt'})
+
+        user.username = 'newer'
+        user.save()
+        self.assertEqual(calls, [user.pk, user.pk])
+        for client in clients:
+            self.assertEqual(json.loads(client.receive()['text'])['data']['username'], 'newer')
+
     def test_get_mixin(self):
         # create object
         obj = User.objects.create_user(username='test', email='t@t.tt')
@@ -213,6 +571,54 @@ class ModelsTestCase(ChannelTestCase):
             self.assertEqual(res['email'], 't@t.tt')
             self.assertEqual(res['is_active'], True)
 
+    def test_instance_cache(self):
+        instance_cache.cache.clear()
+        obj = User.objects.create(username='test', email='t@t.tt')
+        client = HttpClient()
+
+        def get():
+            with CaptureQueriesContext(connection) as queries:
+                client.send_and_consume(u'websocket.receive', {'path': '/{}'.format(obj.pk), 'action': 'get'})
+                client.consume('test')
+            res = client.receive()
+            res = json.loads(json.loads(res['text'])['response']) if 'response' in res['text'] else None
+            return res, len([q for q in queries.captured_queries if 'FROM "auth_user" WHERE' in q['sql']])
+
+        with apply_routes([CRUDConsumers.as_routes(model=User, path='/', channel_name='test',
+                                                   instance_cache_timeout=60)]):
+            client.send_and_consume(u'websocket.connect', {'path': '/{}'.format(obj.pk)})
+            self.assertEqual(get()[1], 1)
+            res, queries = get()
+            self.assertEqual((res['username'], queries), ('test', 0))
+
+            client.send_and_consume('websocket.receive', {'path': '/{}'.format(obj.pk), 'action': 'update',
+                                                          'data': json.dumps({'username': 'new_name'})})
+            client.consume('test')
+            client.receive()
+            res, queries = get()
+            self.assertEqual((res['username'], queries), ('new_name', 1))
+
+            # row is changed by another process: cached copy is stale, but update works with the fresh object
+            User.objects.filter(pk=obj.pk).update(username='other', email='other@t.tt')
+            self.assertEqual(get()[0]['username'], 'new_name')
+            client.send_and_consume('websocket.receive', {'path': '/{}'.format(obj.pk), 'action': 'update',
+                                                          'data': json.dumps({'username': 'new_name'})})
+            client.consume('test')
+            self.assertEqual(json.loads(client.receive()['text']), {'response': 'ok'})
+            self.assertEqual(User.objects.filter(pk=obj.pk).values_list('username', 'email')[0], ('new_name', 'other@t.tt'))
+
+            # mutable values of returned objects are not shared with the cache
+            queryset = User.objects.filter(pk=obj.pk)
+            instance_cache.get(queryset, timeout=60)
+            instance_cache.cache.get(instance_cache._key(queryset))[0].extra = {'tags': ['a']}
+            copy = instance_cache.get(queryset, timeout=60)
+            copy.extra['tags'].append('b')
+            self.assertEqual(instance_cache.get(queryset, timeout=60).extra, {'tags': ['a']})
+
+            User.objects.filter(pk=obj.pk).first().delete()
+            with self.assertRaises(User.DoesNotExist):
+                instance_cache.get(User.objects.filter(pk=obj.pk), timeout=60)
+
     def test_create_mixin(self):
         # create client
         client = HttpClient()
@@ -244,6 +650,62 @@ class ModelsTestCase(ChannelTestCase):
         self.assertTrue(user)
         self.assertEqual(user.username, 'new_name')
 
+    def test_update_mixin_changed_fields(self):
+        obj = User.objects.create(username='test', email='t@t.tt')
+        subscriber, client = HttpClient(), HttpClient()
+
+        saves = []
+        pre_save.connect(lambda sender, update_fields, **kwargs: saves.append(sorted(update_fields or [])), sender=User,
+                         weak=False, dispatch_uid='test_update_fields_pre_save')
+
+        def update(data):
+            del saves[:]
+            client.send_and_consume('websocket.receive', {'path': '/{}'.format(obj.pk), 'action': 'update',
+                                                          'data': json.dumps(data)})
+            client.consume('test')
+            self.assertEqual(json.loads(client.receive()['text']), {'response': 'ok'})
+            return list(saves)
+
+        with apply_routes([ObjectSubscribeConsumers.as_routes(path=r'/sub/(?P<pk>\d+)/?', model=User,
+                                                              serializer_kwargs={'fields': ['username', 'email']}),
+                           UpdateConsumers.as_routes(model=User, path=r'/(?P<pk>\d+)/?', channel_name='test')]):
+            subscriber.send_and_consume('websocket.connect', {'path': '/sub/{}'.format(obj.pk)})
+            client.send_and_consume('websocket.connect', {'path': '/{}'.format(obj.pk)})
+
+            self.assertEqual(update({'username': 'test', 'email': 't@t.tt'}), [])
+            self.assertIsNone(subscriber.receive())
+
+            self.assertEqual(update({'username': 'new_name', 'email': 't@t.tt'}), [['username']])
+            self.assertEqual(json.loads(subscriber.receive()['text'])['data'], {'username': 'new_name'})
+
+        obj.refresh_from_db()
+        self.assertEqual((obj.username, obj.email), ('new_name', 't@t.tt'))
+
+    def test_update_mixin_auto_now(self):
+        note = Note.objects.create(text='test')
+        modified = note.modified
+        Note.objects.filter(pk=note.pk).update(modified=modified.replace(year=2000))
+        client = HttpClient()
+
+        with apply_routes([UpdateConsumers.as_routes(model=Note, path=r'/(?P<pk>\d+)/?', channel_name='test'),
+                           CRUDConsumers.as_routes(model=Note, path='/bulk', channel_name='bulk')]):
+            client.send_and_consume('websocket.receive', {'path': '/{}'.format(note.pk), 'action': 'update',
+                                                          'data': json.dumps({'text': 'new'})})
+            client.consume('test')
+            self.assertEqual(json.loads(client.receive()['text']), {'response': 'ok'})
+            note.refresh_from_db()
+            self.assertEqual(note.text, 'new')
+            self.assertGreaterEqual(note.modified, modified)
+
+            Note.objects.filter(pk=note.pk).update(modified=modified.replace(year=2000))
+            client.send_and_consume('websocket.receive', {'path': '/bulk', 'action': 'bulk_update',
+                                                          'data': json.dumps([{'pk': note.pk, 'text': 'bulk'}])})
+            client.consume('bulk')
+            self.assertEqual(json.loads(client.receive()['text']), {'response': 'ok'})
+            note.refresh_from_db()
+            self.assertEqual(note.text, 'bulk')
+            self.assertGreaterEqual(note.modified, modified)
+
     def test_delete_mixin(self):
         # create object
         obj = User.objects.create_user(username='test', email='t@t.tt')
@@ -276,6 +738,167 @@ class ModelsTestCase(ChannelTestCase):
         self.assertEqual(res[0]['email'], 't@t.tt')
         self.assertEqual(res[0]['is_active'], True)
 
+    def test_list_consumers_stream(self):
+        for i in range(25):
+            User.objects.create(username='test' + str(i), email='t@t.tt')
+        client = HttpClient()
+
+        with apply_routes([ListConsumers.as_routes(model=User, path='/', channel_name='test', stream_chunk_size=10,
+                                                   queryset=User.objects.order_by('pk'))]):
+            client.send_and_consume(u'websocket.connect', {'path': '/'})
+            client.send_and_consume(u'websocket.receive', {'path': '/', 'action': 'list'})
+            client.consume('test')
+
+            self.assertEqual(json.loads(client.receive()['text']), {'stream': 'start'})
+            usernames = []
+            for size in (10, 10, 5):
+                frame = json.loads(client.receive()['text'])
+                self.assertEqual(frame['stream'], 'chunk')
+                chunk = json.loads(frame['response'])
+                self.assertEqual(len(chunk), size)
+                usernames.extend(item['username'] for item in chunk)
+            self.assertEqual(json.loads(client.receive()['text']), {'stream': 'end', 'count': 25})
+            self.assertIsNone(client.receive())
+        self.assertEqual(usernames, ['test' + str(i) for i in range(25)])
+
+    def test_list_consumers_stream_cursor(self):
+        for i in range(25):
+            User.objects.create(username='test' + str(i), email='t@t.tt')
+        client = HttpClient()
+
+        with apply_routes([ListConsumers.as_routes(model=User, path='/', channel_name='test', stream_chunk_size=4,
+                                                   paginate_by=10, paginator_class=CursorPaginator,
+                                                   queryset=User.objects.order_by('pk'))]):
+            client.send_and_consume(u'websocket.connect', {'path': '/'})
+            usernames, cursor, pages = [], None, 0
+            while True:
+                content = {'path': '/', 'action': 'list'}
+                if cursor:
+                    content['cursor'] = cursor
+                client.send_and_consume(u'websocket.receive', content)
+                client.consume('test')
+                self.assertEqual(json.loads(client.receive()['text']), {'stream': 'start'})
+                frame = json.loads(client.receive()['text'])
+                while frame['stream'] == 'chunk':
+                    usernames.extend(item['username'] for item in json.loads(frame['response']))
+                    frame = json.loads(client.receive()['text'])
+                self.assertEqual(frame['stream'], 'end')
+                cursor, pages = frame['next'], pages + 1
+                if cursor is None:
+                    break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(usernames, ['test' + str(i) for i in range(25)])
+
+    def test_list_consumers_cursor(self):
+        for i in range(25):
+            User.objects.create(username='test' + str(i), email='t@t.tt', last_name=str(i % 2))
+        client = HttpClient()
+
+        with apply_routes([ListConsumers.as_routes(model=User, path='/', channel_name='test', paginate_by=10,
+                                                   paginator_class=CursorPaginator,
+                                                   queryset=User.objects.order_by('-last_name'))]):
+            client.send_and_consume(u'websocket.connect', {'path': '/'})
+            usernames, cursor, pages = [], None, 0
+            while True:
+                content = {'path': '/', 'action': 'list'}
+                if cursor:
+                    content['cursor'] = cursor
+                with CaptureQueriesContext(connection) as queries:
+                    client.send_and_consume(u'websocket.receive', content)
+                    client.consume('test')
+                self.assertFalse([q for q in queries.captured_queries if 'COUNT' in q['sql'] or 'OFFSET' in q['sql']])
+                rec = json.loads(client.receive()['text'])
+                usernames.extend(item['username'] for item in json.loads(rec['response']))
+                cursor, pages = rec['next'], pages + 1
+                if cursor is None:
+                    break
+
+            # not a cursor and well formed cursors with values of wrong types
+            for bad in ['bad', ['0', 'x'], ['0', [1]], ['0', None]]:
+                if isinstance(bad, list):
+                    bad = base64.urlsafe_b64encode(json.dumps(bad).encode()).decode()
+                client.send_and_consume(u'websocket.receive', {'path': '/', 'action': 'list', 'cursor': bad})
+                client.consume('test')
+                self.assertEqual(json.loads(client.receive()['text'])['error'], 'Invalid cursor')
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(usernames, ['test' + str(i) for i in range(1, 25, 2)] + ['test' + str(i) for i in range(0, 25, 2)])
+
+    def test_list_consumers_count_cache(self):
+        for i in range(20):
+            User.objects.create(username='test' + str(i), email='t@t.tt')
+        client = HttpClient()
+
+        def count_queries(page):
+            with CaptureQueriesContext(connection) as queries:
+                client.send_and_consume(u'websocket.receive', {'path': '/', 'action': 'list', 'page': page})
+                client.consume('test')
+            res = json.loads(json.loads(client.receive()['text'])['response'])
+            return res, len([q for q in queries.captured_queries if 'COUNT' in q['sql']])
+
+        with apply_routes([ListConsumers.as_routes(model=User, path='/', channel_name='test', paginate_by=10,
+                                                   count_cache_timeout=60, queryset=User.objects.order_by('pk'))]):
+            client.send_and_consume(u'websocket.connect', {'path': '/'})
+            self.assertEqual(count_queries(1)[1], 1)
+            res, count = count_queries(2)
+            self.assertEqual((res[0]['username'], count), ('test10', 0))
+
+            User.objects.create(username='test20', email='t@t.tt')
+            self.assertEqual(count_queries('last')[1], 1)
+            res, count = count_queries(3)
+            self.assertEqual(([item['username'] for item in res], count), (['test20'], 0))
+
+            User.objects.get(username='test20').delete()
+            self.assertEqual(count_queries(1)[1], 1)
+
+    def test_list_consumers_query_budget(self):
+        for i in range(5):
+            User.objects.create(username='test' + str(i), email='t@t.tt')
+        client = HttpClient()
+        sink = MetricsRegistry()
+        labels = ('ListConsumers', 'list', 'test')
+
+        # every list is over the budget, keep its warnings out of the test output
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger('cbchannels.queries').addHandler(handler)
+        try:
+            with apply_routes([ListConsumers.as_routes(model=User, path='/', channel_name='test', paginate_by=10,
+                                                       queryset=User.objects.order_by('pk'), metrics=sink, query_budget=3)]):
+                client.send_and_consume(u'websocket.connect', {'path': '/'})
+                client.send_and_consume(u'websocket.receive', {'path': '/', 'action': 'list', 'page': 1})
+                log_size = len(connection.queries_log)
+                client.consume('test')
+                # queries logged only for counting are not kept
+                self.assertEqual(len(connection.queries_log), log_size)
+                self.assertIn('ListConsumers.list (channel test) made 12 queries', records[0].getMessage())
+                stat = sink.get(labels)
+                # count, page and m2m fields of every user
+                self.assertEqual((stat['queries'], stat['over_budget']), (2 + 5 * 2, 1))
+
+                client.send_and_consume(u'websocket.receive', {'path': '/', 'action': 'list', 'page': 1})
+                with CaptureQueriesContext(connection) as queries:
+                    client.consume('test')
+                count = len(queries.captured_queries)
+                self.assertEqual(sink.get(labels)['queries'], 2 * count)
+
+                # full log of the connection with DEBUG
+                queries_log, connection.queries_log = connection.queries_log, deque([{'sql': '', 'time': '0'}] * 3, maxlen=3)
+                connection.force_debug_cursor = True
+                try:
+                    client.send_and_consume(u'websocket.receive', {'path': '/', 'action': 'list', 'page': 1})
+                    client.consume('test')
+                    self.assertEqual(sink.get(labels)['queries'], 3 * count)
+                    self.assertTrue(all(query['sql'] for query in connection.queries_log))
+                finally:
+                    connection.force_debug_cursor = False
+                    connection.queries_log = queries_log
+        finally:
+            logging.getLogger('cbchannels.queries').removeHandler(handler)
+        self.assertEqual(len(records), 3)
+
     def test_crud_consumers(self):
         # create object
         for i in range(20):
@@ -310,3 +933,53 @@ class ModelsTestCase(ChannelTestCase):
             user = User.objects.filter(pk=11).first()
             self.assertTrue(user)
             self.assertEqual(user.username, 'new_name')
+
+    @skipIf(not hasattr(transaction, 'on_commit'), 'transaction.on_commit requires Django 1.9+')
+    def test_crud_consumers_bulk(self):
+        subscriber, client = HttpClient(), HttpClient()
+
+        def send(action, data):
+            client.send_and_consume(u'websocket.receive', {'path': '/crud/', 'action': action,
+                                                           'data': json.dumps(data)})
+            client.consume('test')
+            res = json.loads(client.receive()['text'])
+            run_commit_callbacks()
+            return res
+
+        with apply_routes([ModelSubscribeConsumers.as_routes(model=User, path='/sub',
+                                                             serializer_kwargs={'fields': ['username']}),
+                           CRUDConsumers.as_routes(model=User, path='/crud/', channel_name='test')]):
+            subscriber.send_and_consume(u'websocket.connect', {'path': '/sub'})
+            client.send_and_consume(u'websocket.connect', {'path': '/crud/'})
+
+            saving = []
+            pre_save.connect(lambda sender, instance, **kwargs: saving.append(instance.username), sender=User,
+                             weak=False, dispatch_uid='test_bulk_pre_save')
+            self.assertEqual(send('bulk_create', [{'username': 'test' + str(i)} for i in range(3)]), {'response': 'ok'})
+            self.assertEqual(list(User.objects.order_by('pk').values_list('username', flat=True)), ['test0', 'test1', 'test2'])
+            self.assertEqual(saving, ['test0', 'test1', 'test2'])
+            self.assertEqual(send('bulk_create', [{'username': 'test3', 'unknown': 'x'}])['error'], 'Unknown fields: unknown')
+            self.assertFalse(User.objects.filter(username='test3').exists())
+            res = json.loads(subscriber.receive()['text'])
+            self.assertEqual(res['action'], 'batch')
+            self.assertEqual([event['data']['username'] for event in res['data']], ['test0', 'test1', 'test2'])
+            self.assertIsNone(subscriber.receive())
+
+            pks = list(User.objects.order_by('pk').values_list('pk', flat=True))
+            self.assertEqual(send('bulk_update', [{'pk': pks[0], 'username': 'new0'}, {'pk': str(pks[1]), 'username': 'new1'}]),
+                             {'response': 'ok'})
+            self.assertEqual(list(User.objects.order_by('pk').values_list('username', flat=True)), ['new0', 'new1', 'test2'])
+            res = json.loads(subscriber.receive()['text'])
+            self.assertEqual([(event['action'], event['data']) for event in res['data']],
+                             [('updated', {'username': 'new0'}), ('updated', {'username': 'new1'})])
+
+            # nothing is changed if one of objects is not found
+            self.assertIn('error', send('bulk_update', [{'pk': pks[2], 'username': 'new2'}, {'pk': 0, 'username': 'x'}]))
+            self.assertIn('error', send('bulk_update', [{'pk': pks[2], 'unknown': 'x'}]))
+            self.assertEqual(User.objects.get(pk=pks[2]).username, 'test2')
+            self.assertIsNone(subscriber.receive())
+
+            self.assertEqual(send('bulk_delete', pks[:2]), {'response': 'ok'})
+            self.assertEqual(list(User.objects.values_list('pk', flat=True)), pks[2:])
+            res = json.loads(subscriber.receive()['text'])
+            self.assertEqual([event['action'] for event in res['data']], ['deleted', 'deleted'])
@@ -2,6 +2,7 @@ import json
 
 from django.utils.functional import cached_property
 from cbchannels import Consumers, consumer, apply_decorator
+from cbchannels.generic.base import GroupMixin
 from channels.auth import channel_session_user_from_http, channel_session_user
 
 from .models import Room
@@ -11,22 +12,18 @@ from .utils import catch_client_error
 PK = '(?P<pk>\d+)'
 
 
-class ChatConsumers(Consumers):
+class ChatConsumers(GroupMixin, Consumers):
     path = r"^/chat/stream"
     channel_name = 'chat'
     decorators = [channel_session_user, catch_client_error]
 
     @apply_decorator(channel_session_user_from_http)
     def on_connect(self, message):
-        message.channel_session['rooms'] = []
+        pass
 
     def on_disconnect(self, message):
-        for room_id in message.channel_session.get("rooms", []):
-            try:
-                room = Room.objects.get(pk=room_id)
-                room.websocket_group.discard(message.reply_channel)
-            except Room.DoesNotExist:
-                pass
+        # joined rooms are remembered in the channel session, no lookups
+        self.leave_all()
 
     def on_receive(self, message):
         payload = json.loads(message['text'])
@@ -35,8 +32,7 @@ class ChatConsumers(Consumers):
 
     @consumer(command="^join$", room=PK)
     def chat_join(self, message, **kwargs):
-        self.group.add(message.reply_channel)
-        message.channel_session['rooms'] = list(set(message.channel_session['rooms']).union([self.room.id]))
+        self.join(self.group.name)
         message.reply_channel.send({
             "text": json.dumps({
                 "join": str(self.room.id),
@@ -46,8 +42,7 @@ class ChatConsumers(Consumers):
 
     @consumer(command="^leave$", room=PK)
     def chat_leave(self, message, **kwargs):
-        self.group.discard(message.reply_channel)
-        message.channel_session['rooms'] = list(set(message.channel_session['rooms']).difference([self.room.id]))
+        self.leave(self.group.name)
         message.reply_channel.send({
             "text": json.dumps({
                 "leave": str(self.room.id),
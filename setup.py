@@ -5,7 +5,7 @@ from setuptools import setup
 setup(
     name='cbchannels',
     version=get_version(),
-    packages=['cbchannels', 'cbchannels.generic'],
+    packages=['cbchannels', 'cbchannels.generic', 'cbchannels.management', 'cbchannels.management.commands'],
     url='https://github.com/Krukov/cbchannels',
     download_url='https://github.com/Krukov/cbchannels/'
                  'tarball/' + get_version(),